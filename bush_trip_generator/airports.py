@@ -0,0 +1,164 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import configargparse
+import csv
+import difflib
+import mmap
+import os
+import struct
+
+from bush_trip_generator.subleg import UserWptSubLeg
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from typing import Iterator, List, Optional, Tuple
+
+IDENT_SIZE = 8
+INDEX_MAGIC = b'BTAPT001'
+INDEX_HEADER = struct.Struct('<8sI')
+INDEX_RECORD = struct.Struct(f'<{IDENT_SIZE}sff')  # ident, latitude, longitude
+MAX_SUGGESTION_CANDIDATES = 4096
+
+
+def _encode_ident(ident: str) -> Optional[bytes]:
+    """Index key of the ident, or None if it does not fit in IDENT_SIZE bytes."""
+    key = ident.strip().upper().encode('ascii', errors='replace')
+    if len(key) > IDENT_SIZE:
+        return None
+    return key.ljust(IDENT_SIZE, b'\0')
+
+
+def import_airports_csv(csv_file: str, index_file: str, *, ident_column: str = 'ident',
+                        latitude_column: str = 'latitude_deg', longitude_column: str = 'longitude_deg'
+                        ) -> Tuple[int, List[str]]:
+    """Compiles an airport dataset (e.g. OurAirports' airports.csv) into a sorted binary index.
+
+    Returns the number of airports indexed, and the idents left out as longer than IDENT_SIZE.
+    """
+    records = dict()
+    skipped = list()
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            ident = _encode_ident(row[ident_column])
+            if ident is None:
+                skipped.append(row[ident_column].strip())
+            elif ident.strip(b'\0'):
+                records[ident] = (float(row[latitude_column] or 0), float(row[longitude_column] or 0))
+
+    with open(index_file, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(records)))
+        for ident in sorted(records):
+            f.write(INDEX_RECORD.pack(ident, *records[ident]))
+    return len(records), skipped
+
+
+class AirportDatabase:
+    """Memory-mapped view of an airport index, looked up by binary search without loading it."""
+
+    def __init__(self, index_file: str):
+        with open(index_file, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Path, size and mtime of the index, so that builds validated against another index are not reused
+        self.identity = f'{os.path.abspath(index_file)}/{stat.st_size}/{stat.st_mtime_ns}'
+        (magic, self._count) = INDEX_HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f'Not an airport index: {index_file}')
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self) -> AirportDatabase:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _offset(self, i: int) -> int:
+        return INDEX_HEADER.size + i * INDEX_RECORD.size
+
+    def _ident(self, i: int) -> bytes:
+        offset = self._offset(i)
+        return self._mmap[offset:offset + IDENT_SIZE]
+
+    def _bisect_left(self, key: bytes) -> int:
+        (lo, hi) = (0, self._count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ident(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _prefix_range(self, prefix: str) -> Iterator[str]:
+        key = prefix.upper().encode('ascii', errors='replace')
+        i = self._bisect_left(key)
+        while i < self._count and self._ident(i).startswith(key):
+            yield self._ident(i).rstrip(b'\0').decode('ascii')
+            i += 1
+
+    def find(self, ident: str) -> Optional[Tuple[float, float]]:
+        key = _encode_ident(ident)
+        if key is None:  # Too long to be in the index
+            return None
+        i = self._bisect_left(key)
+        if i < self._count and self._ident(i) == key:
+            (_, latitude, longitude) = INDEX_RECORD.unpack_from(self._mmap, self._offset(i))
+            return latitude, longitude
+
+    def __contains__(self, ident: str) -> bool:
+        return self.find(ident) is not None
+
+    def suggest(self, ident: str, n: int = 3) -> List[str]:
+        """Near matches for a mistyped ident, among the airports sharing its first letters."""
+        for prefix_length in (2, 1):
+            candidates = list()
+            for candidate in self._prefix_range(ident[:prefix_length]):
+                candidates.append(candidate)
+                if len(candidates) >= MAX_SUGGESTION_CANDIDATES:
+                    break
+            suggestions = difflib.get_close_matches(ident.upper(), candidates, n=n, cutoff=0.5)
+            if suggestions:
+                return suggestions
+        return list()
+
+
+def validate_mission(mission: Mission, airports: AirportDatabase) -> List[str]:
+    """Lists the airports referenced by the mission that are missing from the database."""
+    errors = list()
+
+    def _check(wpt_id: str, where: str):
+        if wpt_id not in airports:
+            suggestions = airports.suggest(wpt_id)
+            hint = f" (did you mean {', '.join(suggestions)}?)" if suggestions else ''
+            errors.append(f'{where}: unknown airport {wpt_id}{hint}')
+
+    _check(mission.initial_leg.last_subleg.wpt_id, 'Initial fix')
+    for leg in mission.legs:
+        for subleg in leg.sublegs:
+            if not isinstance(subleg, UserWptSubLeg):
+                _check(subleg.wpt_id, f'Leg {leg.leg_index + 1}')
+    return errors
+
+
+if __name__ == '__main__':
+    parser = configargparse.Parser(description='Imports an airport dataset into a binary index')
+    parser.add_argument('csv_file')
+    parser.add_argument('index_file')
+    parser.add_argument('--ident-column', default='ident')
+    parser.add_argument('--latitude-column', default='latitude_deg')
+    parser.add_argument('--longitude-column', default='longitude_deg')
+    args = parser.parse_args()
+    (count, skipped) = import_airports_csv(args.csv_file, args.index_file,
+                                           ident_column=args.ident_column,
+                                           latitude_column=args.latitude_column,
+                                           longitude_column=args.longitude_column)
+    for ident in skipped:
+        print(f'warning: {ident} left out, idents are limited to {IDENT_SIZE} characters')
+    print(f'{count} airports indexed into {args.index_file}')
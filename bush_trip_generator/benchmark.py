@@ -0,0 +1,266 @@
+"""Benchmarks the generator's stages on a synthetic mission pack.
+
+Usage: python -m bush_trip_generator.benchmark --missions 50 --legs 10 --sublegs 8 --baseline baseline.json
+
+Each stage (scan of the mission sources, parse, render, write, package through the fake fspackagetool) is timed, along
+with its throughput and peak traced memory. Stages are run --repeat times and their fastest run is kept, while their
+memory is traced in a separate run, as tracing slows them down. With --baseline, results are compared to the stored
+baseline and any stage slower than --tolerance times its baseline fails the run. --save-baseline stores the current
+results as the new baseline. --memory also reports the memory retained by the models of the loaded pack, with and
+without lazy descriptions.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import configargparse
+import functools
+import gc
+import json
+import os
+import random
+import string
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import trio
+import zlib
+
+from bush_trip_generator.concurrency import gather
+from bush_trip_generator.fspackagetool import FsPackageTool
+from bush_trip_generator.mission import load_mission, parse_mission, scan_mission, write_mission
+from bush_trip_generator.pack import find_missions
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable, Dict, List, Tuple
+
+DEFAULT_TOLERANCE = 1.5
+DEFAULT_REPEAT = 5
+
+
+def _png(width: int, height: int, rng: random.Random) -> bytes:
+    def _chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rows = b''.join(b'\0' + bytes(rng.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' +
+            _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            _chunk(b'IDAT', zlib.compress(rows)) +
+            _chunk(b'IEND', b''))
+
+
+def _text(size: int, rng: random.Random) -> str:
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(200)]
+    text = list()
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        text.append(word)
+        length += len(word) + 1
+    return ' '.join(text)[:size]
+
+
+def generate_pack(pack_dir: str, *, missions: int, legs: int, sublegs: int, description_size: int = 200,
+                  images: int = 0, image_size: int = 64, seed: int = 0):
+    """Writes a synthetic source pack of missions x legs x sublegs, with `images` images per mission."""
+    rng = random.Random(seed)
+    for m in range(missions):
+        mission_id = f'mission_{m + 1:04d}'
+        mission_dir = os.path.join(pack_dir, mission_id)
+        os.makedirs(mission_dir, exist_ok=True)
+        with open(os.path.join(mission_dir, f'{mission_id}.json'), 'w') as f:
+            json.dump({'title': f'Mission {m + 1}',
+                       'description': _text(description_size, rng),
+                       'initial_fix': f'K{m % 1000:03d}'}, f)
+
+        image_sublegs = set(rng.sample(range(legs * sublegs), min(images, legs * sublegs)))
+        for leg_index in range(legs):
+            leg_dir = os.path.join(mission_dir, f'leg_{leg_index + 1:02d}')
+            os.makedirs(leg_dir, exist_ok=True)
+            with open(os.path.join(leg_dir, f'leg_{leg_index + 1:02d}.txt'), 'w') as f:
+                f.write(_text(description_size, rng))
+
+            for s in range(sublegs):
+                header = [f'waypoint: K{rng.randrange(1000):03d}' if s == sublegs - 1 else f'user_waypoint: POI{s + 1}']
+                if leg_index * sublegs + s in image_sublegs:
+                    os.makedirs(os.path.join(leg_dir, 'images'), exist_ok=True)
+                    with open(os.path.join(leg_dir, 'images', f'{s + 1}.png'), 'wb') as f:
+                        f.write(_png(image_size, image_size, rng))
+                    header.append(f'image: images/{s + 1}.png')
+                with open(os.path.join(leg_dir, f'subleg.{s + 1:02d}.txt'), 'w') as f:
+                    f.write('\n'.join(header) + '\n\n' + _text(description_size, rng) + '\n')
+
+
+class StageResult:
+    def __init__(self, name: str, duration: float, items: int, peak_memory: int):
+        self.name = name
+        self.duration = duration
+        self.items = items
+        self.peak_memory = peak_memory
+
+    def __str__(self) -> str:
+        throughput = self.items / self.duration if self.duration else float('inf')
+        return (f'{self.name:<10} {self.duration:9.3f}s  {throughput:12.1f} items/s  '
+                f'{self.peak_memory / 1024 / 1024:9.2f} MiB peak')
+
+
+async def _measure(name: str, items: int, async_fn: Callable[[], Awaitable]) -> StageResult:
+    gc.collect()
+    if not tracemalloc.is_tracing():
+        start = time.perf_counter()
+        await async_fn()
+        return StageResult(name, time.perf_counter() - start, items, 0)
+
+    if hasattr(tracemalloc, 'reset_peak'):  # py3.9+, peaks are cumulative across stages on py3.8
+        tracemalloc.reset_peak()
+    (start_memory, _) = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    await async_fn()
+    duration = time.perf_counter() - start
+    (_, peak_memory) = tracemalloc.get_traced_memory()
+    return StageResult(name, duration, items, max(0, peak_memory - start_memory))
+
+
+async def run_benchmark(pack_dir: trio.Path, out_dir: trio.Path, *, fspackagetool: str = None,
+                        repeat: int = DEFAULT_REPEAT) -> List[StageResult]:
+    """Fastest duration of each stage over repeated runs, and its peak memory traced in a separate run."""
+    runs = [await run_stages(pack_dir, out_dir, fspackagetool=fspackagetool) for _ in range(max(1, repeat))]
+    tracemalloc.start()
+    try:
+        traced = await run_stages(pack_dir, out_dir, fspackagetool=fspackagetool)
+    finally:
+        tracemalloc.stop()
+    return [StageResult(stage.name, min(run[i].duration for run in runs), stage.items, stage.peak_memory)
+            for (i, stage) in enumerate(traced)]
+
+
+async def run_stages(pack_dir: trio.Path, out_dir: trio.Path, *, fspackagetool: str = None) -> List[StageResult]:
+    """Runs every stage once, tracing their memory if tracemalloc is tracing."""
+    missions = list()
+    mission_dirs = list()
+    mission_sources = list()
+    await out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Same scan and parse as load_mission(), timed apart
+    async def _scan():
+        mission_dirs.extend(await find_missions(pack_dir))
+        mission_sources.extend(await gather(functools.partial(trio.to_thread.run_sync, scan_mission, d)
+                                            for d in mission_dirs))
+
+    async def _parse():
+        missions.extend(parse_mission(d, metadata, leg_sources)
+                        for (d, (metadata, _, leg_sources)) in zip(mission_dirs, mission_sources))
+
+    async def _render():
+        for mission in missions:
+            mission.dump()
+
+    async def _write():
+        await gather(lambda m=m: write_mission(m, out_dir / f'{m.mission_id}.xml') for m in missions)
+
+    async def _package():
+        project = out_dir / 'project.xml'
+        await project.write_text('<Project />')
+        tool = FsPackageTool(configargparse.Namespace(msfs_sdk_root_dir=trio.Path(),
+                                                      fspackagetool=fspackagetool))
+        result = await tool.run(project, output=out_dir.parent / 'package', incremental=False)
+        if not result.ok:
+            raise RuntimeError(f'Package build failed: {result}')
+
+    stages = [await _measure('scan', 0, _scan)]
+    stages[0].items = len(mission_dirs)
+    stages.append(await _measure('parse', len(mission_dirs), _parse))
+    sublegs = sum(len(leg.sublegs) for mission in missions for leg in mission.legs)
+    stages.append(await _measure('render', sublegs, _render))
+    stages.append(await _measure('write', len(missions), _write))
+    stages.append(await _measure('package', len(missions), _package))
+    return stages
+
+
+async def measure_models_memory(pack_dir: trio.Path, *, lazy_descriptions: bool = False) -> Tuple[int, int]:
+    """Memory retained by the models of a loaded pack (as traced by tracemalloc), and their number of sublegs."""
+    mission_dirs = await find_missions(pack_dir)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        missions = await gather(lambda d=d: load_mission(d, lazy_descriptions=lazy_descriptions) for d in mission_dirs)
+        gc.collect()
+        (memory, _) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return memory, sum(len(leg.sublegs) for mission in missions for leg in mission.legs)
+
+
+def compare_to_baseline(stages: List[StageResult], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    regressions = list()
+    for stage in stages:
+        if stage.name in baseline and stage.duration > baseline[stage.name] * tolerance:
+            regressions.append(f'{stage.name}: {stage.duration:.3f}s vs. {baseline[stage.name]:.3f}s baseline '
+                               f'(x{stage.duration / baseline[stage.name]:.2f})')
+    return regressions
+
+
+def main() -> int:
+    parser = configargparse.Parser(description='Benchmarks the generator on a synthetic mission pack')
+    parser.add_argument('--missions', type=int, default=20)
+    parser.add_argument('--legs', type=int, default=10)
+    parser.add_argument('--sublegs', type=int, default=5)
+    parser.add_argument('--description-size', type=int, default=500)
+    parser.add_argument('--images', type=int, default=2, help='Images per mission')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default=None, help='Where to generate the pack (a temporary dir by default)')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Timed runs of every stage, the fastest of which is kept')
+    parser.add_argument('--memory', action='store_true', help='Report the memory retained by the loaded models')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        pack_dir = os.path.join(work_dir, 'sources')
+        start = time.perf_counter()
+        generate_pack(pack_dir, missions=args.missions, legs=args.legs, sublegs=args.sublegs,
+                      description_size=args.description_size, images=args.images, seed=args.seed)
+        print(f'Generated {args.missions} missions x {args.legs} legs x {args.sublegs} sublegs '
+              f'in {time.perf_counter() - start:.3f}s')
+
+        fake_tool = f'"{sys.executable}" -m bush_trip_generator.fake_fspackagetool'
+        stages = trio.run(functools.partial(run_benchmark, trio.Path(pack_dir), trio.Path(work_dir) / 'out',
+                                            fspackagetool=fake_tool, repeat=args.repeat))
+        for stage in stages:
+            print(stage)
+
+        if args.memory:
+            for lazy_descriptions in (False, True):
+                (memory, sublegs) = trio.run(functools.partial(measure_models_memory, trio.Path(pack_dir),
+                                                               lazy_descriptions=lazy_descriptions))
+                print(f"{'models':<10} {memory / 1024 / 1024:9.2f} MiB  {memory / max(sublegs, 1):9.0f} bytes/subleg  "
+                      f"({'lazy' if lazy_descriptions else 'eager'} descriptions)")
+
+    if not args.baseline:
+        return 0
+    parameters = {key: getattr(args, key)
+                  for key in ('missions', 'legs', 'sublegs', 'description_size', 'images', 'repeat')}
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'parameters': parameters,
+                       'stages': {stage.name: stage.duration for stage in stages}}, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['parameters'] != parameters:
+        print(f"Baseline was recorded with different parameters: {baseline['parameters']}")
+        return 2
+    regressions = compare_to_baseline(stages, baseline['stages'], args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
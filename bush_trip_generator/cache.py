@@ -0,0 +1,94 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import functools
+import hashlib
+import json
+import os
+import trio
+
+from bush_trip_generator.sources import ZipPath
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from trio import CapacityLimiter, Path
+    from typing import Dict, Optional
+
+CACHE_FORMAT_VERSION = 1
+
+
+def _hash_tree(digest, root: str):
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(dir_path, file_name)
+            digest.update(os.path.relpath(file_path, root).replace(os.sep, '/').encode())
+            digest.update(b'\0')
+            with open(file_path, 'rb') as f:
+                for chunk in iter(functools.partial(f.read, 1 << 20), b''):
+                    digest.update(chunk)
+            digest.update(b'\0')
+
+
+@functools.lru_cache(maxsize=None)
+def generator_digest() -> str:
+    """Hash of the generator's own sources, so that any change to the rendering code invalidates the cache."""
+    digest = hashlib.sha256(f'{CACHE_FORMAT_VERSION}'.encode())
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for file_name in sorted(os.listdir(package_dir)):
+        if file_name.endswith('.py'):
+            with open(os.path.join(package_dir, file_name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def hash_mission_sources(source_dir: str, options: str = '') -> str:
+    digest = hashlib.sha256(f'{generator_digest()}\0{options}\0'.encode())
+    _hash_tree(digest, source_dir)
+    return digest.hexdigest()
+
+
+def hash_zipped_mission_sources(source_dir: ZipPath, options: str = '') -> str:
+    """Hash of the paths, sizes and CRC-32 of the mission's files in the central directory of its archive, so that
+    nothing needs to be decompressed."""
+    digest = hashlib.sha256(f'{generator_digest()}\0{options}\0'.encode())
+    for (path, size, crc) in source_dir.signature():
+        digest.update(f'{path}\0{size}\0{crc}\0'.encode())
+    return digest.hexdigest()
+
+
+class BuildCache:
+    def __init__(self, cache_file: Path, entries: Dict[str, str] = None):
+        self.cache_file = cache_file
+        self.entries = entries or dict()
+
+    async def source_digest(self, source_dir: Path, *, options: str = '', limiter: CapacityLimiter = None) -> str:
+        """Hash of the mission's sources, the generator and the build options changing its output."""
+        if isinstance(source_dir, ZipPath):
+            return hash_zipped_mission_sources(source_dir, options)
+        return await trio.to_thread.run_sync(hash_mission_sources, os.fspath(source_dir), options, limiter=limiter)
+
+    async def is_up_to_date(self, mission_id: str, digest: str, output: Path) -> bool:
+        return self.entries.get(mission_id) == digest and await output.is_file()
+
+    def update(self, mission_id: str, digest: Optional[str]):
+        if digest is None:
+            self.entries.pop(mission_id, None)
+        else:
+            self.entries[mission_id] = digest
+
+    async def save(self):
+        await self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        await self.cache_file.write_text(json.dumps({'version': CACHE_FORMAT_VERSION,
+                                                     'missions': self.entries},
+                                                    indent=2, sort_keys=True))
+
+
+async def load_build_cache(cache_file: Path) -> BuildCache:
+    try:
+        content = json.loads(await cache_file.read_text())
+    except (OSError, ValueError):
+        return BuildCache(cache_file)
+
+    if content.get('version') != CACHE_FORMAT_VERSION:
+        return BuildCache(cache_file)
+    return BuildCache(cache_file, content.get('missions'))
@@ -0,0 +1,83 @@
+"""Catalogue of a mission library: lists, searches and validates missions without loading them whole.
+
+Usage: python -m bush_trip_generator.catalogue <pack_dir> [--search TEXT] [--airport-db INDEX] [--cache-size N]
+
+Only the metadata of each mission is read. Legs are only loaded to validate them against the airport index, through a
+bounded cache, so that memory does not grow with the size of the library.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import configargparse
+import contextlib
+import functools
+import time
+import trio
+
+from bush_trip_generator.airports import AirportDatabase, validate_mission
+from bush_trip_generator.concurrency import default_limiter, gather
+from bush_trip_generator.leg import DEFAULT_LEG_CACHE_SIZE, LegCache
+from bush_trip_generator.mission import load_mission_header
+from bush_trip_generator.pack import find_missions
+from bush_trip_generator.sources import open_source
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from trio import CapacityLimiter, Path
+    from typing import List
+
+
+def matches(mission: Mission, text: str) -> bool:
+    text = text.casefold()
+    return any(text in value.casefold() for value in (mission.mission_id, mission.title, mission.description))
+
+
+async def load_catalogue(pack_dir: Path, *, leg_cache: LegCache = None, limiter: CapacityLimiter = None
+                         ) -> List[Mission]:
+    limiter = limiter or default_limiter()
+    return await gather(functools.partial(load_mission_header, mission_dir, limiter=limiter, leg_cache=leg_cache,
+                                          lazy_descriptions=True)
+                        for mission_dir in await find_missions(await open_source(pack_dir)))
+
+
+async def validate_catalogue(missions: List[Mission], airports: AirportDatabase, *, limiter: CapacityLimiter = None
+                             ) -> List[List[str]]:
+    """Validates the missions in worker threads, which load their legs through the missions' leg cache."""
+    limiter = limiter or default_limiter()
+    return await gather(functools.partial(trio.to_thread.run_sync, validate_mission, mission, airports,
+                                          limiter=limiter)
+                        for mission in missions)
+
+
+def main():
+    parser = configargparse.Parser(description='Lists, searches and validates the missions of a pack')
+    parser.add_argument('source_dir', help='Directory or zip archive of the mission pack')
+    parser.add_argument('--search', required=False,
+                        help='Only list the missions whose id, title or description contains this text')
+    parser.add_argument('--airport-db', required=False,
+                        help='Airport index (see bush_trip_generator.airports) to validate ICAO waypoints against')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_LEG_CACHE_SIZE,
+                        help='Maximum number of legs kept in memory while validating')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    leg_cache = LegCache(args.cache_size)
+    missions = trio.run(functools.partial(load_catalogue, trio.Path(args.source_dir), leg_cache=leg_cache))
+    if args.search:
+        missions = [mission for mission in missions if matches(mission, args.search)]
+
+    errors = [list() for _ in missions]
+    with AirportDatabase(args.airport_db) if args.airport_db else contextlib.nullcontext() as airports:
+        if airports is not None:
+            errors = trio.run(functools.partial(validate_catalogue, missions, airports))
+
+    for (mission, mission_errors) in zip(missions, errors):
+        status = f'{len(mission_errors)} errors' if mission_errors else ('valid' if airports is not None else '')
+        print(f'{mission.mission_id:<40} {len(mission.legs):>3} legs  {mission.title}  {status}'.rstrip())
+        for error in mission_errors:
+            print(f'    {error}')
+    print(f'{len(missions)} missions in {time.perf_counter() - start:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Thin client of the build daemon (see bush_trip_generator.daemon).
+
+Usage: python -m bush_trip_generator.client [--socket PATH] build|validate <source_dir> [generator options]
+       python -m bush_trip_generator.client [--socket PATH] shutdown
+
+The command line is forwarded as is to the daemon, which resolves relative paths against the client's working
+directory. Only the standard library is imported, so that a build of an unchanged pack returns in milliseconds.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+
+COMMANDS = ('build', 'validate', 'shutdown')
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), f'bush_trip_generator-{os.getuid()}.sock')
+
+
+def send_request(socket_path: str, command: str, args: list, cwd: str = None) -> int:
+    """Sends a request to the daemon and prints its output as it comes, returning its exit status."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({'command': command, 'args': args, 'cwd': cwd or os.getcwd()}).encode() + b'\n')
+        with sock.makefile('r', encoding='utf-8') as responses:
+            for line in responses:
+                response = json.loads(line)
+                if 'output' in response:
+                    print(response['output'], flush=True)
+                if 'status' in response:
+                    return response['status']
+    print('The daemon closed the connection without a status', file=sys.stderr)
+    return 1
+
+
+def main(argv=None) -> int:
+    args = list(sys.argv[1:] if argv is None else argv)
+    socket_path = DEFAULT_SOCKET_PATH
+    if args[:1] == ['--socket'] and len(args) > 1:
+        socket_path = args[1]
+        args = args[2:]
+    if not args or args[0] not in COMMANDS:
+        print(__doc__.strip(), file=sys.stderr)
+        return 2
+
+    try:
+        return send_request(socket_path, args[0], args[1:])
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f'No build daemon listening on {socket_path}, start one with: python -m bush_trip_generator.daemon',
+              file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
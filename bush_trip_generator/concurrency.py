@@ -0,0 +1,52 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import multiprocessing
+import trio
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from typing import Any, Awaitable, Callable, Iterable, List
+
+DEFAULT_MAX_CONCURRENT_LOADS = 16
+
+
+def default_limiter() -> trio.CapacityLimiter:
+    return trio.CapacityLimiter(DEFAULT_MAX_CONCURRENT_LOADS)
+
+
+async def gather(async_fns: Iterable[Callable[[], Awaitable[Any]]]) -> List[Any]:
+    """Runs the given async callables concurrently, and returns their results in the given order.
+
+    The first exception raised cancels the remaining tasks and propagates out of the nursery.
+    """
+    async_fns = list(async_fns)
+    results = [None] * len(async_fns)
+
+    async def _run(index: int, async_fn: Callable[[], Awaitable[Any]]):
+        results[index] = await async_fn()
+
+    async with trio.open_nursery() as nursery:
+        for i, fn in enumerate(async_fns):
+            nursery.start_soon(_run, i, fn)
+    return results
+
+
+def process_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """Pool of worker processes started from a fresh interpreter.
+
+    Workers start on the first submission, while trio's worker threads are running: forking then could copy a lock
+    held by one of these threads into a child, and deadlock it.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+async def run_in_executor(executor: Executor, fn: Callable[..., Any], *args: Any) -> Any:
+    """Submits fn to a concurrent.futures executor (e.g. a process pool), and waits for its result in a worker thread."""
+    future = executor.submit(fn, *args)
+    try:
+        return await trio.to_thread.run_sync(future.result, cancellable=True)
+    finally:
+        future.cancel()
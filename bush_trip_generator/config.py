@@ -1,20 +1,70 @@
 import configargparse
+import os
 
+from bush_trip_generator.localization import DEFAULT_LANGUAGE
+from bush_trip_generator.navlog import DEFAULT_CRUISE_SPEED
 from trio import Path
+from typing import List
 
 
-def parse_sys_args() -> configargparse.Namespace:
+def parse_sys_args(args: List[str] = None) -> configargparse.Namespace:
     parser = configargparse.Parser()
-    parser.add_argument('source_dir')
+    parser.add_argument('source_dir', help='Directory or zip archive of the mission pack')
     parser.add_argument('--msfs-sdk-root-dir', default=Path('C:/') / 'MSFS SDK')
     parser.add_argument('--out-dir', required=False)
     parser.add_argument('--tmp-dir', required=False)
-    settings = parser.parse_args()
-    settings.source_xml_project = Path(settings.source_xml_project)
+    parser.add_argument('--project', action='append', default=[],
+                        help='fspackagetool project to build once the missions are up to date (repeatable)')
+    parser.add_argument('--package-dir', required=False)
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Ignore the build cache and rebuild every mission and package')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Maximum number of concurrent file operations')
+    parser.add_argument('--processes', type=int, nargs='?', default=0, const=os.cpu_count(),
+                        help='Render missions in a pool of worker processes (defaults to one per core)')
+    parser.add_argument('--optimize-images', action='store_true',
+                        help='Resize, re-encode and deduplicate subleg images into <out-dir>/images')
+    parser.add_argument('--snapshot', required=False,
+                        help='Compiled snapshot of the parsed pack, reused for unchanged missions')
+    parser.add_argument('--airport-db', required=False,
+                        help='Airport index (see bush_trip_generator.airports) to validate ICAO waypoints against')
+    parser.add_argument('--aircraft-range', type=float, default=None,
+                        help='Warn about legs longer than this range, in nautical miles')
+    parser.add_argument('--cruise-speed', type=float, default=DEFAULT_CRUISE_SPEED,
+                        help='Cruise speed used to estimate the time enroute, in knots')
+    parser.add_argument('--navlog', action='store_true',
+                        help='Append the distance, course and estimated time enroute of each leg to its description')
+    parser.add_argument('--localize', action='store_true',
+                        help='Replace titles and descriptions by TT: keys, written to a pack-wide <language>.locPak')
+    parser.add_argument('--loc-language', default=DEFAULT_LANGUAGE,
+                        help='Language of the texts of the sources, naming the .locPak file')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running, and rebuild and re-package the missions whose sources change')
+    parser.add_argument('--fspackagetool', required=False,
+                        help='Command replacing the SDK fspackagetool, e.g. "python -m bush_trip_generator.fake_fspackagetool"')
+    parser.add_argument('--package-jobs', type=int, default=2,
+                        help='Maximum number of package builds running in parallel')
+    parser.add_argument('--package-timeout', type=float, default=None,
+                        help='Seconds after which a package build attempt is killed')
+    parser.add_argument('--package-retries', type=int, default=1,
+                        help='Number of retries of package builds failing with a transient error')
+    parser.add_argument('--layout', action='store_true',
+                        help='Generate or update the layout.json and manifest.json of the built packages')
+    parser.add_argument('--trace', required=False,
+                        help='Record per-stage spans into a Chrome trace file (chrome://tracing, Perfetto)')
+    parser.add_argument('--trace-top', type=int, default=10,
+                        help='Number of slowest missions and stages to summarize when tracing')
+    settings = parser.parse_args(args)
+    settings.source_dir = Path(settings.source_dir)
     settings.msfs_sdk_root_dir = Path(settings.msfs_sdk_root_dir)
-    settings.out_dir = Path(settings.out_dir) if settings.out_dir else None
+    # Zipped packs are built into a directory named after the archive, without its extension
+    settings.pack_name = (settings.source_dir.stem if settings.source_dir.suffix.lower() == '.zip'
+                          else settings.source_dir.name)
+    settings.out_dir = (Path(settings.out_dir) if settings.out_dir
+                        else Path(__file__).parent.parent / 'tmp' / settings.pack_name)
     settings.tmp_dir = Path(settings.tmp_dir) if settings.tmp_dir else None
+    settings.project = [Path(project) for project in settings.project]
+    settings.package_dir = Path(settings.package_dir) if settings.package_dir else None
+    settings.snapshot = Path(settings.snapshot) if settings.snapshot else None
     return settings
 
-
-SETTINGS = parse_sys_args()
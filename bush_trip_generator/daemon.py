@@ -0,0 +1,256 @@
+"""Long-lived build daemon, keeping the parsed missions of packs in memory between builds.
+
+Usage: python -m bush_trip_generator.daemon [--socket PATH] [--processes [N]]
+
+Requests are sent by bush_trip_generator.client over a Unix socket, as a line of JSON:
+    {"command": "build" | "validate" | "shutdown", "args": [<generator command line>], "cwd": <client dir>}
+and answered with any number of {"output": <text>} lines, followed by a single {"status": <exit code>} line.
+
+Missions are invalidated by the stat signature (size and mtime of every file) of their sources: unchanged missions
+are neither parsed nor rendered again as long as their output still exists.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import configargparse
+import contextlib
+import io
+import json
+import os
+import time
+import trio
+
+from bush_trip_generator.airports import AirportDatabase, validate_mission
+from bush_trip_generator.client import DEFAULT_SOCKET_PATH
+from bush_trip_generator.concurrency import gather, process_pool
+from bush_trip_generator.config import parse_sys_args
+from bush_trip_generator.fspackagetool import package_projects
+from bush_trip_generator.localization import StringTable
+from bush_trip_generator.pack import MissionBuildResult, PackBuilder, find_missions, format_summary
+from bush_trip_generator.snapshot import PackSnapshot
+from bush_trip_generator.sources import open_source
+from trio import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from bush_trip_generator.snapshot import Signature
+    from concurrent.futures import Executor
+    from typing import Dict, List, Optional, Tuple
+
+MAX_REQUEST_SIZE = 1 << 20
+PATH_SETTINGS = ('source_dir', 'msfs_sdk_root_dir', 'out_dir', 'tmp_dir', 'package_dir', 'snapshot', 'airport_db')
+
+
+async def is_listening(socket_path: str) -> bool:
+    """Whether a daemon answers on the socket, unlike the stale socket file of a daemon which did not stop cleanly."""
+    with trio.socket.socket(trio.socket.AF_UNIX, trio.socket.SOCK_STREAM) as sock:
+        try:
+            await sock.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+class WarmPackBuilder(PackBuilder):
+    """Pack builder keeping parsed missions in memory, and skipping the missions whose sources did not change since
+    their last successful build.
+
+    Descriptions are left out of the models kept in memory, and read from the sources when rendered.
+    """
+
+    def __init__(self, out_dir: Path, **kwargs):
+        super().__init__(out_dir, snapshot=PackSnapshot(None), lazy_descriptions=True, **kwargs)
+        self.lock = trio.Lock()
+        self.built: Dict[str, Tuple[Signature, str]] = dict()  # Mission id -> (signature, build options)
+
+    def forget(self):
+        self.snapshot.entries.clear()
+        self.built.clear()
+
+    async def _build_mission(self, source_dir: Path, *, mission: Mission = None) -> MissionBuildResult:
+        start = time.perf_counter()
+        output = self.out_dir / f'{source_dir.name}.xml'
+        # The airport index is swapped per request: missions built against another one are built again
+        signature = (await self.snapshot.signature(source_dir, limiter=self.limiter), self.options)
+        if mission is None and self.built.get(source_dir.name) == signature and await output.is_file():
+            return MissionBuildResult(source_dir.name, output=output, duration=time.perf_counter() - start,
+                                      skipped=True)
+
+        self.built.pop(source_dir.name, None)
+        result = await super()._build_mission(source_dir, mission=mission)
+        if result.ok:
+            self.built[source_dir.name] = signature
+        return result
+
+    async def validate_mission(self, source_dir: Path) -> MissionBuildResult:
+        start = time.perf_counter()
+        warnings = list()
+        try:
+            mission = await self.load(source_dir)
+            warnings = await self.check(source_dir, mission)
+            if self.airports is not None and (errors := validate_mission(mission, self.airports)):
+                raise ValueError('\n'.join(errors))
+        except Exception as e:
+            return MissionBuildResult(source_dir.name, duration=time.perf_counter() - start, error=e,
+                                      warnings=warnings)
+        return MissionBuildResult(source_dir.name, duration=time.perf_counter() - start, warnings=warnings)
+
+    async def validate_pack(self, pack_dir: Path) -> List[MissionBuildResult]:
+        return await gather(lambda mission_dir=mission_dir: self.validate_mission(mission_dir)
+                            for mission_dir in await find_missions(pack_dir))
+
+
+class BuildDaemon:
+    def __init__(self, *, executor: Executor = None):
+        self.executor = executor
+        self.builders: Dict[tuple, WarmPackBuilder] = dict()
+        self.airports: Dict[str, Tuple[int, AirportDatabase]] = dict()
+        self.cancel_scope: Optional[trio.CancelScope] = None
+        self.stopping = False
+
+    def parse_args(self, args: List[str], cwd: str) -> configargparse.Namespace:
+        settings = parse_sys_args(args)
+        # Paths are relative to the client, not to the daemon
+        for name in PATH_SETTINGS:
+            value = getattr(settings, name)
+            if value is not None:
+                setattr(settings, name, Path(cwd) / value)
+        settings.project = [Path(cwd) / project for project in settings.project]
+        return settings
+
+    async def open_airports(self, airport_db: Path) -> Optional[AirportDatabase]:
+        if airport_db is None:
+            return None
+        mtime = (await airport_db.stat()).st_mtime_ns
+        (cached_mtime, airports) = self.airports.get(os.fspath(airport_db), (None, None))
+        if cached_mtime != mtime:
+            if airports is not None:
+                airports.close()
+            airports = AirportDatabase(os.fspath(airport_db))
+            self.airports[os.fspath(airport_db)] = (mtime, airports)
+        return airports
+
+    async def builder(self, settings: configargparse.Namespace) -> WarmPackBuilder:
+        key = (os.fspath(settings.source_dir), os.fspath(settings.out_dir), settings.jobs, settings.optimize_images,
+               settings.aircraft_range, settings.cruise_speed, settings.navlog, settings.localize,
+               settings.loc_language)
+        if key not in self.builders:
+            strings = None
+            if settings.localize:
+                # Starts empty, as the first build of a daemon's builder renders every mission of the pack
+                strings = StringTable((settings.tmp_dir or settings.out_dir) / '.bush_trip_strings.json',
+                                      settings.out_dir / f'{settings.loc_language}.locPak',
+                                      prefix=settings.pack_name, language=settings.loc_language)
+            self.builders[key] = WarmPackBuilder(settings.out_dir, jobs=settings.jobs, executor=self.executor,
+                                                 optimize_images=settings.optimize_images,
+                                                 aircraft_range=settings.aircraft_range,
+                                                 cruise_speed=settings.cruise_speed, navlog=settings.navlog,
+                                                 strings=strings)
+        builder = self.builders[key]
+        builder.airports = await self.open_airports(settings.airport_db)
+        return builder
+
+    async def build(self, settings: configargparse.Namespace) -> Tuple[int, str]:
+        start = time.perf_counter()
+        builder = await self.builder(settings)
+        async with builder.lock:
+            if settings.rebuild:
+                builder.forget()
+            results = await builder.build_pack(await open_source(settings.source_dir))
+        output = [format_summary(results, time.perf_counter() - start)]
+        if any(not result.ok for result in results):
+            return 1, '\n'.join(output)
+
+        if settings.project and (settings.rebuild or not all(result.skipped for result in results)):
+            package_results = await package_projects(settings)
+            output.extend(str(result) for result in package_results)
+            if not all(result.ok for result in package_results):
+                return 1, '\n'.join(output)
+        return 0, '\n'.join(output)
+
+    async def validate(self, settings: configargparse.Namespace) -> Tuple[int, str]:
+        start = time.perf_counter()
+        builder = await self.builder(settings)
+        async with builder.lock:
+            results = await builder.validate_pack(await open_source(settings.source_dir))
+        failures = [result for result in results if not result.ok]
+        return (1 if failures else 0,
+                '\n'.join([str(result) for result in results] +
+                          [f'{len(results) - len(failures)} missions valid, {len(failures)} invalid '
+                           f'in {time.perf_counter() - start:.3f}s']))
+
+    async def handle_request(self, request: dict) -> Tuple[int, str]:
+        command = request.get('command')
+        if command == 'shutdown':
+            self.stopping = True
+            return 0, 'Build daemon stopped'
+        if command not in ('build', 'validate'):
+            return 2, f'Unknown command: {command}'
+
+        usage = io.StringIO()
+        try:
+            # argparse reports usage errors on stderr before exiting: send them to the client instead
+            with contextlib.redirect_stderr(usage):
+                settings = self.parse_args(request.get('args', []), request.get('cwd', os.getcwd()))
+        except SystemExit as e:
+            return e.code or 0, usage.getvalue().rstrip()
+        # Worker processes are those of the daemon (see its own --processes), and parsed missions are kept in memory
+        unsupported = [option for (option, value) in (('--watch', settings.watch), ('--trace', settings.trace),
+                                                      ('--processes', settings.processes),
+                                                      ('--snapshot', settings.snapshot))
+                       if value]
+        if unsupported:
+            return 2, (f"{', '.join(unsupported)} not supported by the daemon, "
+                       "run bush_trip_generator.main instead")
+        return await (self.build(settings) if command == 'build' else self.validate(settings))
+
+    async def handle_connection(self, stream: trio.SocketStream):
+        async with stream:
+            data = b''
+            while b'\n' not in data and len(data) < MAX_REQUEST_SIZE:
+                chunk = await stream.receive_some()
+                if not chunk:
+                    return
+                data += chunk
+            try:
+                (status, output) = await self.handle_request(json.loads(data.split(b'\n', 1)[0]))
+            except Exception as e:
+                (status, output) = (1, f'Internal error: {e!r}')
+            responses = ([{'output': output}] if output else []) + [{'status': status}]
+            with contextlib.suppress(trio.BrokenResourceError):
+                await stream.send_all(b''.join(json.dumps(response).encode() + b'\n' for response in responses))
+        if self.stopping:
+            self.cancel_scope.cancel()
+
+    async def serve(self, socket_path: str):
+        if await is_listening(socket_path):
+            raise SystemExit(f'A build daemon is already listening on {socket_path}')
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+        sock = trio.socket.socket(trio.socket.AF_UNIX, trio.socket.SOCK_STREAM)
+        await sock.bind(socket_path)
+        sock.listen()
+        print(f'Build daemon listening on {socket_path}')
+        try:
+            with trio.CancelScope() as self.cancel_scope:
+                await trio.serve_listeners(self.handle_connection, [trio.SocketListener(sock)])
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(socket_path)
+            for (_, airports) in self.airports.values():
+                airports.close()
+
+
+def main():
+    parser = configargparse.Parser(description='Keeps the parsed missions of packs in memory between builds')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH)
+    parser.add_argument('--processes', type=int, nargs='?', default=0, const=os.cpu_count(),
+                        help='Render missions in a pool of worker processes (defaults to one per core)')
+    args = parser.parse_args()
+
+    with process_pool(args.processes) if args.processes != 0 else contextlib.nullcontext() as executor:
+        trio.run(BuildDaemon(executor=executor).serve, args.socket)
+
+
+if __name__ == '__main__':
+    main()
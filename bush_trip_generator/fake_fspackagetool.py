@@ -0,0 +1,63 @@
+"""Stand-in for the MSFS SDK's fspackagetool, to run and benchmark the packaging pipeline without the SDK.
+
+Usage: python -m bush_trip_generator.fake_fspackagetool <project.xml> [-outputdir DIR] [-tempdir DIR] [-rebuild]
+
+Every file next to the project is copied into <outputdir>/Packages/<project name>/, skipping files already up to date
+unless -rebuild is given. Its behaviour can be tuned with environment variables:
+ - FAKE_FSPACKAGETOOL_DELAY: seconds to sleep per build, to simulate the real tool's cost
+ - FAKE_FSPACKAGETOOL_FAIL: 'error' to fail the build, 'transient' to fail it as if a file was locked
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='fspackagetool', prefix_chars='-')
+    parser.add_argument('project')
+    parser.add_argument('-outputdir', default=None)
+    parser.add_argument('-tempdir', default=None)
+    parser.add_argument('-rebuild', action='store_true')
+    args = parser.parse_args(argv)
+
+    project_dir = os.path.dirname(os.path.abspath(args.project))
+    project_name = os.path.splitext(os.path.basename(args.project))[0]
+    output_dir = os.path.abspath(args.outputdir or project_dir)
+    package_dir = os.path.join(output_dir, 'Packages', project_name)
+    print(f'Building project {args.project}')
+
+    time.sleep(float(os.environ.get('FAKE_FSPACKAGETOOL_DELAY', 0)))
+    failure = os.environ.get('FAKE_FSPACKAGETOOL_FAIL')
+    if failure == 'transient':
+        print(f'Error: the process cannot access {args.project} because it is being used by another process',
+              file=sys.stderr)
+        return 1
+    if failure:
+        print(f'Error: failed to build {project_name}', file=sys.stderr)
+        return 1
+
+    if args.rebuild:
+        shutil.rmtree(package_dir, ignore_errors=True)
+
+    excluded_dirs = {os.path.abspath(d) for d in (output_dir, os.path.join(output_dir, 'Packages'), args.tempdir)
+                     if d and os.path.abspath(d) != project_dir}
+    copied = 0
+    for dir_path, dir_names, file_names in os.walk(project_dir):
+        dir_names[:] = [d for d in dir_names if os.path.abspath(os.path.join(dir_path, d)) not in excluded_dirs]
+        for file_name in file_names:
+            source = os.path.join(dir_path, file_name)
+            target = os.path.join(package_dir, os.path.relpath(source, project_dir))
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            copied += 1
+
+    print(f'Package {project_name} built: {copied} files updated')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import os
+import re
+import trio
+
+from bush_trip_generator.leg import Leg
+from bush_trip_generator.sources import ZipPath
+from bush_trip_generator.subleg import ICAOSubLeg, UserWptSubLeg
+from typing import TYPE_CHECKING
+from xml.etree import ElementTree
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from trio import Path
+    from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+RE_DMS = r'(?P<{0}_hemisphere>[NSEW])(?P<{0}_deg>\d+)°\s*(?P<{0}_min>\d+)\'\s*(?P<{0}_sec>[\d.]+)"'
+RE_LLA = re.compile(rf'^\s*{RE_DMS.format("lat")}\s*,\s*{RE_DMS.format("lon")}\s*,\s*(?P<alt>[+-]?[\d.]+)\s*$')
+
+
+def parse_lla(lla: str) -> Tuple[float, float, float]:
+    """Parses a 'N45° 51' 9.80",E1° 10' 21.90",+001270.00' string into (latitude, longitude, altitude in feet)."""
+    m = RE_LLA.match(lla)
+    if not m:
+        raise ValueError(f'Malformed LLA: {lla}')
+
+    def _degrees(axis: str) -> float:
+        degrees = int(m.group(f'{axis}_deg')) + int(m.group(f'{axis}_min')) / 60 + float(m.group(f'{axis}_sec')) / 3600
+        return -degrees if m.group(f'{axis}_hemisphere') in 'SW' else degrees
+
+    return _degrees('lat'), _degrees('lon'), float(m.group('alt'))
+
+
+class Waypoint:
+    def __init__(self, wpt_id: str, wpt_type: str, latitude: float, longitude: float, altitude: float, *,
+                 icao: str = None):
+        self.wpt_id = wpt_id
+        self.wpt_type = wpt_type
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.icao = icao
+
+    @property
+    def is_airport(self) -> bool:
+        return self.wpt_type == 'Airport'
+
+    def __repr__(self) -> str:
+        return f'Waypoint({self.wpt_id!r}, {self.wpt_type!r}, {self.latitude:.6f}, {self.longitude:.6f}, icao={self.icao!r})'
+
+
+class FlightPlan:
+    def __init__(self, departure_id: str = None, destination_id: str = None, waypoints: List[Waypoint] = None):
+        self.departure_id = departure_id
+        self.destination_id = destination_id
+        self.waypoints = waypoints or list()
+        self.by_id: Dict[str, List[Waypoint]] = dict()
+        self.by_icao: Dict[str, Waypoint] = dict()
+        for waypoint in self.waypoints:
+            self._index(waypoint)
+
+    def _index(self, waypoint: Waypoint):
+        self.by_id.setdefault(waypoint.wpt_id, list()).append(waypoint)
+        if waypoint.icao:
+            self.by_icao.setdefault(waypoint.icao, waypoint)
+
+    def append(self, waypoint: Waypoint):
+        self.waypoints.append(waypoint)
+        self._index(waypoint)
+
+    def find(self, wpt_id: str) -> Optional[Waypoint]:
+        if wpt_id in self.by_icao:
+            return self.by_icao[wpt_id]
+        if wpt_id in self.by_id:
+            return self.by_id[wpt_id][0]
+
+
+def _parse_waypoint(element: ElementTree.Element) -> Waypoint:
+    (latitude, longitude, altitude) = parse_lla(element.findtext('WorldPosition', ''))
+    return Waypoint(wpt_id=element.get('id'),
+                    wpt_type=element.findtext('ATCWaypointType'),
+                    latitude=latitude,
+                    longitude=longitude,
+                    altitude=altitude,
+                    icao=element.findtext('ICAO/ICAOIdent'))
+
+
+def parse_flight_plan(source_file: Union[str, BinaryIO]) -> FlightPlan:
+    """Parses a .pln file incrementally: each waypoint element is dropped as soon as it is indexed,
+    so that memory only grows with the index, not with the size of the document."""
+    plan = FlightPlan()
+    parents = list()
+    for (event, element) in ElementTree.iterparse(source_file, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if element.tag == 'ATCWaypoint':
+            plan.append(_parse_waypoint(element))
+            parents[-1].remove(element)
+        elif element.tag == 'DepartureID':
+            plan.departure_id = element.text
+        elif element.tag == 'DestinationID':
+            plan.destination_id = element.text
+    return plan
+
+
+async def load_flight_plan(source_file: Path) -> FlightPlan:
+    if isinstance(source_file, ZipPath):
+        return await trio.to_thread.run_sync(lambda: parse_flight_plan(source_file.open_binary()))
+    return await trio.to_thread.run_sync(parse_flight_plan, os.fspath(source_file))
+
+
+def derive_legs(plan: FlightPlan, mission_id: str = None) -> List[Leg]:
+    """Splits the flight plan into legs ending at each airport, with one subleg per waypoint."""
+    legs = list()
+    sublegs = list()
+    for waypoint in plan.waypoints[1:]:
+        if waypoint.icao:
+            sublegs.append(ICAOSubLeg(wpt_id=waypoint.icao, description=''))
+        else:
+            sublegs.append(UserWptSubLeg(leg_index=len(legs), wpt_id=waypoint.wpt_id, description=''))
+
+        if waypoint.is_airport:
+            legs.append(Leg(leg_index=len(legs), description='', sublegs=sublegs, mission_id=mission_id))
+            sublegs = list()
+
+    if sublegs:
+        legs.append(Leg(leg_index=len(legs), description='', sublegs=sublegs, mission_id=mission_id))
+    return legs
+
+
+def cross_check(mission: Mission, plan: FlightPlan) -> List[str]:
+    """Lists the waypoints of the mission that can't be found in its flight plan."""
+    warnings = list()
+    if plan.waypoints and mission.initial_leg.last_subleg.wpt_id != plan.departure_id:
+        warnings.append(f'Initial fix {mission.initial_leg.last_subleg.wpt_id} differs from the flight plan '
+                        f'departure {plan.departure_id}')
+
+    for leg in mission.legs:
+        for subleg in leg.sublegs:
+            if isinstance(subleg, UserWptSubLeg):
+                if subleg.wpt_id not in plan.by_id:
+                    warnings.append(f'Leg {leg.leg_index + 1}: user waypoint {subleg.wpt_id} not in the flight plan')
+            elif subleg.wpt_id not in plan.by_icao:
+                warnings.append(f'Leg {leg.leg_index + 1}: airport {subleg.wpt_id} not in the flight plan')
+    return warnings
@@ -1,19 +1,205 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import functools
+import os
+import re
+import shlex
+import time
 import trio
 
+from bush_trip_generator.concurrency import gather
+from bush_trip_generator.layout import load_layout_cache, update_layout
+from bush_trip_generator.tracing import span
 from configargparse import Namespace
 from trio import Path
+from typing import TYPE_CHECKING
+from xml.etree import ElementTree
+
+if TYPE_CHECKING:
+    from bush_trip_generator.layout import LayoutCache, LayoutResult
+    from typing import Iterable, List, Optional
+
+RE_ERROR_LINE = re.compile(r'\berror\b', re.IGNORECASE)
+RE_WARNING_LINE = re.compile(r'\bwarning\b', re.IGNORECASE)
+RE_TRANSIENT_FAILURE = re.compile(r'being used by another process|access is denied|sharing violation|timed? ?out',
+                                  re.IGNORECASE)
+
+
+def project_package_dirs(project_file: str, output_dir: str = None) -> List[str]:
+    """Directories of the packages built from an fspackagetool project (blocking).
+
+    Packages are named after their package definitions, in the packages folder of the project's output directory.
+    Projects without package definitions, as those of the fake fspackagetool, are named after the project file.
+    """
+    project_dir = os.path.dirname(os.path.abspath(project_file))
+    try:
+        project = ElementTree.parse(project_file).getroot()
+    except (OSError, ElementTree.ParseError):
+        project = ElementTree.Element('Project')
+    if output_dir is None:
+        output_dir = os.path.join(project_dir, (project.findtext('OutputDirectory') or '.').strip().replace('\\', '/'))
+    packages_dir = os.path.join(output_dir, project.get('FolderName') or 'Packages')
+
+    names = list()
+    for definition in project.iterfind('Packages/Package'):
+        definition_file = os.path.join(project_dir, (definition.text or '').strip().replace('\\', '/'))
+        try:
+            name = ElementTree.parse(definition_file).getroot().get('Name')
+        except (OSError, ElementTree.ParseError):
+            name = None
+        names.append(name or os.path.splitext(os.path.basename(definition_file))[0])
+    if not names:
+        names.append(os.path.splitext(os.path.basename(project_file))[0])
+    return [os.path.normpath(os.path.join(packages_dir, name)) for name in names]
+
+
+class PackageJobResult:
+    def __init__(self, project: Path, *, returncode: int = None, stdout: str = '', stderr: str = '',
+                 duration: float = 0.0, attempts: int = 1, timed_out: bool = False):
+        self.project = project
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.attempts = attempts
+        self.timed_out = timed_out
+        self.layouts: List[LayoutResult] = list()
+        self.layout_error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and self.layout_error is None
+
+    @property
+    def errors(self) -> List[str]:
+        return [line for line in (self.stdout + self.stderr).splitlines() if RE_ERROR_LINE.search(line)]
+
+    @property
+    def warnings(self) -> List[str]:
+        return [line for line in (self.stdout + self.stderr).splitlines() if RE_WARNING_LINE.search(line)]
+
+    @property
+    def is_transient_failure(self) -> bool:
+        return self.timed_out or (not self.ok and bool(RE_TRANSIENT_FAILURE.search(self.stdout + self.stderr)))
+
+    def __str__(self) -> str:
+        if self.timed_out:
+            status = 'TIMED OUT'
+        elif self.layout_error is not None:
+            status = f'FAILED: layout: {self.layout_error}'
+        elif not self.ok:
+            status = f'FAILED ({self.returncode}): ' + '; '.join(self.errors or self.stderr.splitlines()[-1:])
+        else:
+            status = f'ok, {len(self.warnings)} warnings'
+        retries = f' after {self.attempts} attempts' if self.attempts > 1 else ''
+        layout = ''
+        if self.layouts:
+            layout = f', layout {"updated" if any(result.changed for result in self.layouts) else "up to date"}'
+        return f'{self.project.name:<40} {self.duration:8.3f}s  {status}{retries}{layout}'
 
 
 class FsPackageTool:
     def __init__(self, cfg: Namespace):
         self.pkg_tool = cfg.msfs_sdk_root_dir / 'Tools' / 'bin' / 'fspackagetool.exe'
+        # Stand-in command (e.g. the fake tool on Linux) replacing the SDK's fspackagetool
+        self.pkg_tool_command = shlex.split(cfg.fspackagetool) if cfg.fspackagetool else [self.pkg_tool]
+
+    def command(self, project: Path, *, incremental: bool = True, output: Path = None, temp: Path = None) -> list:
+        return list(filter(None,
+                           self.pkg_tool_command +
+                           [project,
+                            '-outputdir' if output else None,
+                            f'{output}' if output else None,
+                            '-tempdir' if temp else None,
+                            f'{temp}' if temp else None,
+                            '-rebuild' if not incremental else None]))
+
+    async def package_dirs(self, project: Path, *, output: Path = None) -> List[Path]:
+        """Directories of the packages built from the project."""
+        return [Path(package_dir)
+                for package_dir in await trio.to_thread.run_sync(project_package_dirs, os.fspath(project),
+                                                                 os.fspath(output) if output else None)]
 
     async def build(self, project: Path, *, incremental: bool = True, output: Path = None, temp: Path = None):
-        await trio.run_process(command=list(filter(None,
-                                                   [self.pkg_tool,
-                                                    project,
-                                                    '-outputdir' if output else None,
-                                                    f'{output}' if output else None,
-                                                    '-tempdir' if temp else None,
-                                                    f'{temp}' if temp else None,
-                                                    '-rebuild' if not incremental else None])))
+        await trio.run_process(command=self.command(project, incremental=incremental, output=output, temp=temp))
+
+    async def run(self, project: Path, *, incremental: bool = True, output: Path = None, temp: Path = None,
+                  timeout: float = None) -> PackageJobResult:
+        """Runs a single build, capturing its output instead of raising on failure."""
+        start = time.perf_counter()
+        with trio.move_on_after(timeout if timeout is not None else float('inf')) as cancel_scope:
+            try:
+                process = await trio.run_process(self.command(project, incremental=incremental, output=output,
+                                                              temp=temp),
+                                                 capture_stdout=True, capture_stderr=True, check=False)
+            except OSError as e:  # E.g. the SDK is not installed: fails this build alone, not the others
+                return PackageJobResult(project, stderr=f'{e}', duration=time.perf_counter() - start)
+        if cancel_scope.cancelled_caught:
+            return PackageJobResult(project, duration=time.perf_counter() - start, timed_out=True)
+        return PackageJobResult(project,
+                                returncode=process.returncode,
+                                stdout=process.stdout.decode(errors='replace'),
+                                stderr=process.stderr.decode(errors='replace'),
+                                duration=time.perf_counter() - start)
+
+
+class PackageScheduler:
+    """Runs many package builds in parallel, with a timeout per attempt and retries of transient failures.
+
+    With a layout cache, the layout.json and manifest.json of every package built are then generated or updated.
+    """
+
+    def __init__(self, tool: FsPackageTool, *, max_parallel: int = 2, timeout: float = None, retries: int = 1,
+                 retry_delay: float = 1.0, layout_cache: LayoutCache = None):
+        self.tool = tool
+        self.layout_cache = layout_cache
+        self.limiter = trio.CapacityLimiter(max_parallel)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    async def build(self, project: Path, *, incremental: bool = True, output: Path = None, temp: Path = None
+                    ) -> PackageJobResult:
+        async with self.limiter:
+            start = time.perf_counter()
+            for attempt in range(1, self.retries + 2):
+                with span('fspackagetool', 'package', project=project.name, attempt=attempt):
+                    result = await self.tool.run(project, incremental=incremental, output=output, temp=temp,
+                                                 timeout=self.timeout)
+                if result.ok or not result.is_transient_failure or attempt > self.retries:
+                    break
+                await trio.sleep(self.retry_delay * attempt)
+            result.attempts = attempt
+            if result.ok and self.layout_cache is not None:
+                with span('layout', 'package', project=project.name):
+                    try:
+                        for package_dir in await self.tool.package_dirs(project, output=output):
+                            result.layouts.append(await update_layout(package_dir, cache=self.layout_cache))
+                    except OSError as e:  # E.g. the package was not built where expected: fails this job alone
+                        result.layout_error = f'{e}'
+            result.duration = time.perf_counter() - start
+        return result
+
+    async def build_all(self, projects: Iterable[Path], *, incremental: bool = True, output: Path = None,
+                        temp: Path = None) -> List[PackageJobResult]:
+        return await gather(functools.partial(self.build, project, incremental=incremental, output=output, temp=temp)
+                            for project in projects)
+
+
+async def package_projects(cfg: Namespace, *, incremental: bool = None) -> List[PackageJobResult]:
+    """Packages the projects, incrementally unless --rebuild is set (or as told by incremental)."""
+    layout_cache = None
+    if cfg.layout:
+        layout_cache = await load_layout_cache((cfg.tmp_dir or cfg.out_dir) / '.bush_trip_layout_cache.json')
+    scheduler = PackageScheduler(FsPackageTool(cfg),
+                                 max_parallel=cfg.package_jobs,
+                                 timeout=cfg.package_timeout,
+                                 retries=cfg.package_retries,
+                                 layout_cache=layout_cache)
+    results = await scheduler.build_all(cfg.project,
+                                        incremental=not cfg.rebuild if incremental is None else incremental,
+                                        output=cfg.package_dir,
+                                        temp=cfg.tmp_dir)
+    if layout_cache is not None:
+        await layout_cache.save()
+    return results
@@ -0,0 +1,117 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import hashlib
+import io
+import os
+import trio
+
+from bush_trip_generator.concurrency import default_limiter, gather, run_in_executor
+from typing import TYPE_CHECKING
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it, images are only deduplicated and copied as is
+    Image = None
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from concurrent.futures import Executor
+    from trio import CapacityLimiter, Path
+    from typing import Dict, Optional, Tuple
+
+DEFAULT_IMAGE_MAX_SIZE = (1024, 1024)
+DEFAULT_JPEG_QUALITY = 85
+
+
+def _write_atomically(output: str, data: bytes):
+    partial = os.path.join(os.path.dirname(output), f'.{os.path.basename(output)}.partial')
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, output)
+
+
+def optimize_image(data: bytes, output_stem: str, source_suffix: str, max_size: Tuple[int, int], quality: int) -> str:
+    """Resizes and re-encodes an image, and writes it next to output_stem. Returns the file name written.
+
+    Opaque images are re-encoded as JPEG, images with transparency as optimized PNG.
+    """
+    if Image is None:
+        output = f'{output_stem}{source_suffix.lower()}'
+        _write_atomically(output, data)
+        return os.path.basename(output)
+
+    encoded = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail(max_size, Image.LANCZOS)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            output = f'{output_stem}.png'
+            image.save(encoded, 'PNG', optimize=True)
+        else:
+            output = f'{output_stem}.jpg'
+            image.convert('RGB').save(encoded, 'JPEG', quality=quality, optimize=True, progressive=True)
+    _write_atomically(output, encoded.getvalue())
+    return os.path.basename(output)
+
+
+class ImageOptimizer:
+    def __init__(self, out_dir: Path, *, assets_dir: str = 'images', executor: Executor = None,
+                 limiter: CapacityLimiter = None, max_size: Tuple[int, int] = DEFAULT_IMAGE_MAX_SIZE,
+                 quality: int = DEFAULT_JPEG_QUALITY):
+        self.assets_dir = assets_dir
+        self.output_dir = out_dir / assets_dir
+        self.executor = executor
+        self.limiter = limiter or default_limiter()
+        self.max_size = max_size
+        self.quality = quality
+        self._assets: Dict[str, Optional[str]] = dict()
+        self._pending: Dict[str, trio.Event] = dict()
+
+    @property
+    def options(self) -> str:
+        """Settings changing the assets, and the image paths of the missions."""
+        return f'{self.assets_dir}/{self.max_size}/{self.quality}/{Image is not None}'
+
+    def _content_key(self, data: bytes) -> str:
+        digest = hashlib.sha256(f'{self.max_size}/{self.quality}/{Image is not None}\0'.encode())
+        digest.update(data)
+        return digest.hexdigest()[:32]
+
+    async def _cached_asset(self, key: str) -> Optional[str]:
+        cached = next(iter(await self.output_dir.glob(f'{key}.*')), None)
+        return cached.name if cached else None
+
+    async def _process(self, key: str, data: bytes, source_suffix: str) -> str:
+        args = (data, os.fspath(self.output_dir / key), source_suffix, self.max_size, self.quality)
+        if self.executor is None:
+            return await trio.to_thread.run_sync(optimize_image, *args, limiter=self.limiter)
+        return await run_in_executor(self.executor, optimize_image, *args)
+
+    async def optimize(self, source: Path) -> str:
+        """Returns the path of the optimized asset, relative to the output directory."""
+        async with self.limiter:
+            data = await source.read_bytes()
+        key = self._content_key(data)
+
+        if key in self._pending:
+            await self._pending[key].wait()
+        else:
+            self._pending[key] = trio.Event()
+            try:
+                await self.output_dir.mkdir(parents=True, exist_ok=True)
+                self._assets[key] = await self._cached_asset(key) or await self._process(key, data, source.suffix)
+            finally:
+                self._pending[key].set()
+
+        if self._assets.get(key) is None:
+            raise ValueError(f'Failed to optimize image {source}')
+        return f'{self.assets_dir}/{self._assets[key]}'
+
+    async def optimize_mission(self, mission: Mission):
+        """Optimizes every image referenced by the mission's sublegs, and points them to the optimized assets."""
+        async def _optimize_subleg(leg, subleg):
+            subleg.image = await self.optimize(leg.source_dir / subleg.image)
+
+        await gather(lambda leg=leg, subleg=subleg: _optimize_subleg(leg, subleg)
+                     for leg in mission.legs
+                     for subleg in leg.sublegs
+                     if subleg.image)
@@ -0,0 +1,263 @@
+"""Generation of the layout.json and manifest.json files making a built package installable.
+
+Usage: python -m bush_trip_generator.layout <package_dir> [--cache FILE] [--changed PATH] [--jobs N] [--title TITLE]
+                                           [--creator NAME]
+
+The layout lists the path, size and date of every file of the package: files are only stat'ed, never read. Directories
+are scanned concurrently in worker threads, and a stat cache keeps the listing of every package, so that the layout and
+manifest are only generated and rewritten when a file was added, removed or modified since.
+
+Unless the caller knows which files changed since the cached listing, and only these are stat'ed again, every file of
+the package is stat'ed on each update: this is the case after fspackagetool builds, whose output files are not known.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import configargparse
+import json
+import os
+import posixpath
+import stat
+import time
+import trio
+
+from bush_trip_generator.concurrency import default_limiter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from trio import CapacityLimiter, Path
+    from typing import Dict, Iterable, List
+
+    # Per directory (relative to the package, '' for its root), as stored in the JSON cache:
+    # [[sub-directory name], {file name: [size, mtime]}]
+    DirListing = List
+
+LAYOUT_CACHE_FORMAT_VERSION = 1
+LAYOUT_FILE = 'layout.json'
+MANIFEST_FILE = 'manifest.json'
+# Files of the package which are not part of its content
+EXCLUDED_FILES = {LAYOUT_FILE, MANIFEST_FILE, 'MSFSLayoutGenerator.exe'}
+# Offset between the Unix epoch and the Windows FILETIME epoch (1601-01-01), in 100 ns intervals
+FILETIME_EPOCH_OFFSET = 116444736000000000
+
+DEFAULT_MANIFEST = {
+    'dependencies': [],
+    'content_type': 'MISSION',
+    'title': '',
+    'manufacturer': '',
+    'creator': '',
+    'package_version': '1.0.0',
+    'minimum_game_version': '1.0.0',
+    'release_notes': {'neutral': {'LastUpdate': '', 'OlderHistory': ''}},
+}
+
+
+def filetime(mtime_ns: int) -> int:
+    return mtime_ns // 100 + FILETIME_EPOCH_OFFSET
+
+
+def scan_dir(package_dir: str, rel_dir: str) -> DirListing:
+    """Sub-directories and (size, mtime) of the files of a directory of the package."""
+    sub_dirs = list()
+    files = dict()
+    # The entries of os.scandir() carry their stat on Windows, and cost a single stat call elsewhere
+    with os.scandir(os.path.join(package_dir, rel_dir)) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                sub_dirs.append(entry.name)
+            elif entry.is_file() and (rel_dir or entry.name not in EXCLUDED_FILES):
+                file_stat = entry.stat()
+                files[entry.name] = [file_stat.st_size, file_stat.st_mtime_ns]
+    return [sorted(sub_dirs), files]
+
+
+def restat_files(package_dir: str, listings: Dict[str, DirListing], paths: Iterable[str]) -> Dict[str, DirListing]:
+    """Listings updated with the stat of the given files alone (blocking): removed files are dropped, new ones added.
+
+    The given listings are left untouched: the listings of the directories of the files are copied.
+    """
+    listings = dict(listings)
+    copied = set()
+
+    def _listing(rel_dir: str) -> DirListing:
+        if rel_dir not in copied:
+            (sub_dirs, files) = listings.get(rel_dir, ([], dict()))
+            listings[rel_dir] = [list(sub_dirs), dict(files)]
+            copied.add(rel_dir)
+        return listings[rel_dir]
+
+    for path in paths:
+        (rel_dir, name) = posixpath.split(path.replace(os.sep, '/').strip('/'))
+        if not rel_dir and name in EXCLUDED_FILES:
+            continue
+        try:
+            file_stat = os.stat(os.path.join(package_dir, rel_dir, name))
+        except FileNotFoundError:
+            file_stat = None
+        if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+            if name in listings.get(rel_dir, ([], dict()))[1]:
+                del _listing(rel_dir)[1][name]
+            continue
+
+        _listing(rel_dir)[1][name] = [file_stat.st_size, file_stat.st_mtime_ns]
+        # Directories new to the listings are added to their parent's
+        child = rel_dir
+        while child:
+            (parent, child_name) = posixpath.split(child)
+            if child_name in listings.get(parent, ([], dict()))[0]:
+                break
+            sub_dirs = _listing(parent)[0]
+            sub_dirs.append(child_name)
+            sub_dirs.sort()
+            child = parent
+    return listings
+
+
+class LayoutCache:
+    def __init__(self, cache_file: Path, entries: Dict[str, Dict[str, DirListing]] = None):
+        self.cache_file = cache_file
+        self.entries = entries or dict()
+        self.is_dirty = False
+
+    def get(self, package_dir: Path) -> Dict[str, DirListing]:
+        return self.entries.get(os.fspath(package_dir), dict())
+
+    def put(self, package_dir: Path, listings: Dict[str, DirListing]):
+        self.entries[os.fspath(package_dir)] = listings
+        self.is_dirty = True
+
+    async def save(self):
+        if not self.is_dirty:
+            return
+        await self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        await self.cache_file.write_text(json.dumps({'version': LAYOUT_CACHE_FORMAT_VERSION,
+                                                     'packages': self.entries}))
+        self.is_dirty = False
+
+
+async def load_layout_cache(cache_file: Path) -> LayoutCache:
+    try:
+        content = json.loads(await cache_file.read_text())
+    except (OSError, ValueError):
+        return LayoutCache(cache_file)
+
+    if content.get('version') != LAYOUT_CACHE_FORMAT_VERSION:
+        return LayoutCache(cache_file)
+    return LayoutCache(cache_file, content.get('packages'))
+
+
+class LayoutResult:
+    def __init__(self, package_dir: Path, *, files: int = 0, total_size: int = 0, changed: bool = False,
+                 duration: float = 0.0):
+        self.package_dir = package_dir
+        self.files = files
+        self.total_size = total_size
+        self.changed = changed
+        self.duration = duration
+
+    def __str__(self) -> str:
+        status = 'updated' if self.changed else 'up to date'
+        return (f'{self.package_dir.name:<40} {self.duration:8.3f}s  layout {status}, '
+                f'{self.files} files, {self.total_size} bytes')
+
+
+async def scan_package(package_dir: Path, *, limiter: CapacityLimiter = None) -> Dict[str, DirListing]:
+    """Listings of every directory of the package, scanned concurrently in worker threads."""
+    limiter = limiter or default_limiter()
+    listings = dict()
+
+    async def _scan(rel_dir: str, nursery: trio.Nursery):
+        listing = await trio.to_thread.run_sync(scan_dir, os.fspath(package_dir), rel_dir, limiter=limiter)
+        listings[rel_dir] = listing
+        for name in listing[0]:
+            nursery.start_soon(_scan, f'{rel_dir}/{name}' if rel_dir else name, nursery)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(_scan, '', nursery)
+    return listings
+
+
+def layout_content(listings: Dict[str, DirListing]) -> List[dict]:
+    content = [{'path': f'{rel_dir}/{name}' if rel_dir else name, 'size': size, 'date': filetime(mtime)}
+               for (rel_dir, (_, files)) in listings.items()
+               for (name, (size, mtime)) in files.items()]
+    return sorted(content, key=lambda entry: entry['path'])
+
+
+async def _write_if_changed(file: Path, text: str) -> bool:
+    try:
+        if await file.read_text(encoding='utf-8') == text:
+            return False
+    except OSError:
+        pass
+    await file.write_text(text, encoding='utf-8')
+    return True
+
+
+async def update_layout(package_dir: Path, *, cache: LayoutCache = None, manifest: dict = None,
+                        changed: Iterable[str] = None, limiter: CapacityLimiter = None) -> LayoutResult:
+    """Generates or updates the layout.json of the package, and the total size in its manifest.json.
+
+    With a cached listing of the package, only the changed files (paths relative to the package) are stat'ed again when
+    they are given. A missing manifest is created from the given fields, completed by DEFAULT_MANIFEST.
+    """
+    start = time.perf_counter()
+    cached = cache.get(package_dir) if cache is not None else dict()
+    if changed is not None and cached:
+        listings = await trio.to_thread.run_sync(restat_files, os.fspath(package_dir), cached, list(changed),
+                                                 limiter=limiter or default_limiter())
+    else:
+        listings = await scan_package(package_dir, limiter=limiter)
+    file_count = sum(len(files) for (_, files) in listings.values())
+    total_size = sum(size for (_, files) in listings.values() for (size, _) in files.values())
+    if (listings == cached and await (package_dir / LAYOUT_FILE).is_file() and
+            await (package_dir / MANIFEST_FILE).is_file()):
+        return LayoutResult(package_dir, files=file_count, total_size=total_size, duration=time.perf_counter() - start)
+
+    if cache is not None:
+        cache.put(package_dir, listings)
+    content = layout_content(listings)
+    changed = await _write_if_changed(package_dir / LAYOUT_FILE, json.dumps({'content': content}, indent=2))
+
+    try:
+        package_manifest = json.loads(await (package_dir / MANIFEST_FILE).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        package_manifest = {**DEFAULT_MANIFEST, 'title': package_dir.name, **(manifest or dict())}
+    package_manifest['total_package_size'] = f'{total_size:020d}'
+    changed |= await _write_if_changed(package_dir / MANIFEST_FILE, json.dumps(package_manifest, indent=2))
+    return LayoutResult(package_dir, files=file_count, total_size=total_size, changed=changed,
+                        duration=time.perf_counter() - start)
+
+
+async def update_layouts(package_dirs: List[Path], *, cache_file: Path = None, manifest: dict = None,
+                         changed: List[str] = None, jobs: int = None) -> List[LayoutResult]:
+    cache = await load_layout_cache(cache_file) if cache_file else None
+    limiter = trio.CapacityLimiter(jobs) if jobs else default_limiter()
+    results = [await update_layout(package_dir, cache=cache, manifest=manifest, changed=changed, limiter=limiter)
+               for package_dir in package_dirs]
+    if cache is not None:
+        await cache.save()
+    return results
+
+
+def main():
+    parser = configargparse.Parser(description='Generates or updates the layout.json and manifest.json of packages')
+    parser.add_argument('package_dir', nargs='+')
+    parser.add_argument('--cache', required=False, help='Stat cache file, reused by the next updates')
+    parser.add_argument('--changed', action='append', default=None,
+                        help='Path (relative to the package) of a file changed since the cached listing: only these '
+                             'files are stat\'ed again')
+    parser.add_argument('--jobs', type=int, default=None, help='Maximum number of directories scanned concurrently')
+    parser.add_argument('--title', required=False, help='Title of created manifests (defaults to the package name)')
+    parser.add_argument('--creator', required=False, help='Creator of created manifests')
+    args = parser.parse_args()
+
+    manifest = {key: value for (key, value) in (('title', args.title), ('creator', args.creator)) if value}
+    results = trio.run(lambda: update_layouts([trio.Path(package_dir) for package_dir in args.package_dir],
+                                              cache_file=trio.Path(args.cache) if args.cache else None,
+                                              manifest=manifest, changed=args.changed, jobs=args.jobs))
+    for result in results:
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
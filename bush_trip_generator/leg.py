@@ -1,55 +1,39 @@
 from __future__ import annotations  # Allow forward reference type annotation in py3.8
 
 import bush_trip_generator.subleg
-import uuid
+import collections.abc
+import fnmatch
+import functools
+import threading
+import trio
 
+from bush_trip_generator.concurrency import default_limiter
+from bush_trip_generator.sources import list_source_dir, natural_key, read_source_text
+from bush_trip_generator.sourcetext import LazyText, SourceText, source_text
+from bush_trip_generator.template import Template
+from bush_trip_generator.tracing import span
+from bush_trip_generator.uuids import format_uuid, instance_uuid_bytes
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from bush_trip_generator.subleg import SubLeg
-    from trio import Path
-    from typing import List, Optional
+    from trio import CapacityLimiter, Path
+    from typing import List, Optional, OrderedDict, Tuple, Union
 
+    LegSources = Tuple[Path, Union[str, SourceText], List[Tuple[Path, str]]]
 
-class Leg:
-    def __init__(self, leg_index: int = None, description: str = None, sublegs: List[SubLeg] = None):
-        self.leg_index = leg_index
-        self.description = description
-        self.sublegs = sublegs
-        self.end_trigger_uuid = f"{{{str(uuid.uuid1()).upper()}}}"
-
-    @property
-    def index(self) -> int:
-        return 0
+DEFAULT_LEG_CACHE_SIZE = 64
 
-    @property
-    def last_subleg(self) -> Optional[SubLeg]:
-        if self.sublegs:
-            return self.sublegs[-1]
-
-    def dump(self, prev: Leg) -> str:
-        return f"""<Leg>
-                      <Descr>{self.description}</Descr>
-                      {self.dump_leg_completion_trigger_ref()}
+LEG_TEMPLATE = Template("""<Leg>
+                      <Descr>{description}</Descr>
+                      {completion_trigger_ref}
                       <SubLegs>
-                      {self._dump_sublegs(initial_subleg=prev.last_subleg)}
+                      {sublegs}
                       </SubLegs>
-                   </Leg>"""
-
-    def _dump_sublegs(self, initial_subleg: SubLeg) -> str:
-        if not self.sublegs:
-            return ''
-
-        return '\n'.join([subleg.dump(prev=prev)
-                          for (prev, subleg) in zip([initial_subleg] + self.sublegs[:-1],
-                                                    self.sublegs)])
-
-    def dump_leg_completion_trigger_ref(self) -> str:
-        return f'<AirportLandingTriggerEnd UniqueRefId="{self.end_trigger_uuid}" />'
-
-    def dump_leg_completion_trigger(self) -> str:
-        return f"""<SimMission.AirportCalculator InstanceId="{self.end_trigger_uuid}">
-      <AirportIdent>{self.last_subleg.wpt_id}</AirportIdent>
+                   </Leg>""")
+LEG_COMPLETION_TRIGGER_REF_TEMPLATE = Template('<AirportLandingTriggerEnd UniqueRefId="{end_trigger_uuid}" />')
+LEG_COMPLETION_TRIGGER_TEMPLATE = Template("""<SimMission.AirportCalculator InstanceId="{end_trigger_uuid}">
+      <AirportIdent>{airport_ident}</AirportIdent>
       <ComputeAirportPolygon>true</ComputeAirportPolygon>
       <Activated>false</Activated>
       <CalculatorParameterList>
@@ -109,13 +93,145 @@ class Leg:
         </CalculatorAction>
       </CalculatorActions>
     </SimMission.AirportCalculator>
-"""
+""")
+
+
+class Leg:
+    __slots__ = ('leg_index', 'source_dir', '_description', 'sublegs', '_end_trigger_uuid')
+
+    description = LazyText('_description')
+
+    def __init__(self, leg_index: int = None, description: Union[str, SourceText] = None,
+                 sublegs: List[SubLeg] = None, mission_id: str = None, source_dir: Path = None):
+        self.leg_index = leg_index
+        self.source_dir = source_dir
+        self.description = description
+        self.sublegs = sublegs
+        self._end_trigger_uuid = instance_uuid_bytes(mission_id, 'leg', leg_index, 'end_trigger')
+
+    @property
+    def end_trigger_uuid(self) -> str:
+        return format_uuid(self._end_trigger_uuid)
+
+    @property
+    def index(self) -> int:
+        return 0
+
+    @property
+    def last_subleg(self) -> Optional[SubLeg]:
+        if self.sublegs:
+            return self.sublegs[-1]
+
+    def dump(self, prev: Leg) -> bytes:
+        return LEG_TEMPLATE.dump(description=self.description,
+                                 completion_trigger_ref=self.dump_leg_completion_trigger_ref(),
+                                 sublegs=self._dump_sublegs(initial_subleg=prev.last_subleg))
+
+    def _dump_sublegs(self, initial_subleg: SubLeg) -> bytes:
+        if not self.sublegs:
+            return b''
+
+        return b'\n'.join([subleg.dump(prev=prev)
+                            for (prev, subleg) in zip([initial_subleg] + self.sublegs[:-1], self.sublegs)])
+
+    def dump_leg_completion_trigger_ref(self) -> bytes:
+        return LEG_COMPLETION_TRIGGER_REF_TEMPLATE.dump(end_trigger_uuid=self.end_trigger_uuid)
+
+    def dump_leg_completion_trigger(self) -> bytes:
+        return LEG_COMPLETION_TRIGGER_TEMPLATE.dump(end_trigger_uuid=self.end_trigger_uuid,
+                                                    airport_ident=self.last_subleg.wpt_id)
+
+
+def scan_leg(source_dir: Path, *, lazy_description: bool = False) -> LegSources:
+    """Reads the description and the subleg sources of a leg, sorted by subleg number, in a single pass (blocking)."""
+    with span('scan leg', 'io', mission=source_dir.parent.name, leg=source_dir.name):
+        entries = list_source_dir(source_dir)
+        description_file = source_dir / f"{source_dir.name}.txt"
+        description = source_text(description_file) if lazy_description else read_source_text(description_file)
+        subleg_source_files = [source_dir / name
+                               for name in sorted(fnmatch.filter(entries, 'subleg.*'), key=natural_key)
+                               if not entries[name]]
+        return (source_dir,
+                description,
+                [(subleg_source_file, read_source_text(subleg_source_file))
+                 for subleg_source_file in subleg_source_files])
+
+
+def parse_leg(leg_sources: LegSources, *, lazy_descriptions: bool = False) -> Leg:
+    (source_dir, description, subleg_sources) = leg_sources
+    with span('parse leg', 'parse', mission=source_dir.parent.name, leg=source_dir.name):
+        leg_index = int(source_dir.name.replace('leg_', '')) - 1
+        return Leg(leg_index=leg_index,
+                   mission_id=source_dir.parent.name,
+                   source_dir=source_dir,
+                   description=description,
+                   sublegs=[bush_trip_generator.subleg.parse_subleg(leg_index, text, subleg_source_file,
+                                                                    lazy_description=lazy_descriptions)
+                            for (subleg_source_file, text) in subleg_sources])
+
+
+async def load_leg(source_dir: Path, *, limiter: CapacityLimiter = None, lazy_descriptions: bool = False) -> Leg:
+    leg_sources = await trio.to_thread.run_sync(functools.partial(scan_leg, source_dir,
+                                                                  lazy_description=lazy_descriptions),
+                                                limiter=limiter or default_limiter())
+    return parse_leg(leg_sources, lazy_descriptions=lazy_descriptions)
+
+
+class LegCache:
+    """Legs loaded on demand, keeping only the most recently used ones in memory."""
+
+    def __init__(self, max_size: int = DEFAULT_LEG_CACHE_SIZE):
+        self.max_size = max_size
+        self.legs: OrderedDict[Tuple[str, bool], Leg] = collections.OrderedDict()
+        self.lock = threading.Lock()  # Legs are loaded from worker threads too
+
+    def get(self, source_dir: Path, *, lazy_descriptions: bool = False) -> Leg:
+        """Returns the leg, loading it (blocking) if it is not cached."""
+        key = (str(source_dir), lazy_descriptions)
+        with self.lock:
+            if key in self.legs:
+                self.legs.move_to_end(key)
+                return self.legs[key]
+
+        leg = parse_leg(scan_leg(source_dir, lazy_description=lazy_descriptions), lazy_descriptions=lazy_descriptions)
+        with self.lock:
+            self.legs[key] = leg
+            while len(self.legs) > self.max_size:
+                self.legs.popitem(last=False)
+        return leg
+
+    def clear(self):
+        with self.lock:
+            self.legs.clear()
+
+
+# Shared by the lazy missions that are not given their own cache, including those unpickled in worker processes
+DEFAULT_LEG_CACHE = LegCache()
+
+
+class LazyLegs(collections.abc.Sequence):
+    """Legs of a mission, each loaded with its sublegs on first access, through a bounded LegCache.
+
+    Legs are only known by their source directories until then. They are meant to be read: changes made to a leg are
+    lost once the cache evicts it.
+    """
+
+    __slots__ = ('source_dirs', 'cache', 'lazy_descriptions')
+
+    def __init__(self, source_dirs: List[Path], cache: LegCache = None, lazy_descriptions: bool = False):
+        self.source_dirs = source_dirs
+        self.cache = cache or DEFAULT_LEG_CACHE
+        self.lazy_descriptions = lazy_descriptions
 
+    def __len__(self) -> int:
+        return len(self.source_dirs)
 
-async def load_leg(source_dir: Path) -> Leg:
-    leg_index = int(source_dir.name.replace('leg_', '')) - 1
+    def __getitem__(self, index: Union[int, slice]) -> Union[Leg, List[Leg]]:
+        if isinstance(index, slice):
+            return [self.cache.get(source_dir, lazy_descriptions=self.lazy_descriptions)
+                    for source_dir in self.source_dirs[index]]
+        return self.cache.get(self.source_dirs[index], lazy_descriptions=self.lazy_descriptions)
 
-    return Leg(leg_index=leg_index,
-               description=await (source_dir / f"{source_dir.name}.txt").read_text(),
-               sublegs=[await bush_trip_generator.subleg.load_subleg(leg_index, subleg_source_file)
-                        for subleg_source_file in await source_dir.glob('subleg.*')])
+    def __reduce__(self):
+        # Caches hold a lock and are local to each process: unpickled legs use the default one
+        return LazyLegs, (self.source_dirs, None, self.lazy_descriptions)
@@ -0,0 +1,98 @@
+"""Pack-wide localization string table: user-facing texts of the missions are replaced by TT: keys, and written once,
+deduplicated, into a .locPak file.
+
+Keys are hashes of the texts, so that the same text gets the same key in every mission, and in every build. Texts are
+kept per mission in a table file, so that missions skipped by incremental builds keep their strings in the .locPak.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import hashlib
+import json
+import re
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from trio import Path
+    from typing import Dict, Iterable, Optional
+
+STRING_TABLE_FORMAT_VERSION = 1
+DEFAULT_LANGUAGE = 'en-US'
+KEY_PREFIX = 'TT:'
+RE_KEY_UNSAFE = re.compile(r'[^A-Za-z0-9_.]')
+
+
+def string_key(prefix: str, text: str) -> str:
+    return f'{prefix}.{hashlib.sha1(text.encode()).hexdigest()[:16]}'
+
+
+class StringTable:
+    def __init__(self, table_file: Path, loc_pak_file: Path, *, prefix: str, language: str = DEFAULT_LANGUAGE,
+                 missions: Dict[str, Dict[str, str]] = None):
+        self.table_file = table_file
+        self.loc_pak_file = loc_pak_file
+        self.prefix = RE_KEY_UNSAFE.sub('_', prefix)
+        self.language = language
+        self.missions = missions or dict()  # Mission id -> {key: text}
+        self.is_dirty = False
+
+    def localize(self, mission: Mission):
+        """Replaces the title and descriptions of the mission, its legs and sublegs by TT: keys."""
+        strings = dict()
+
+        def _key(text: Optional[str]) -> Optional[str]:
+            if not text or text.startswith(KEY_PREFIX):
+                return text
+            key = string_key(self.prefix, text)
+            strings[key] = text
+            return f'{KEY_PREFIX}{key}'
+
+        mission.title = _key(mission.title)
+        mission.description = _key(mission.description)
+        for leg in mission.legs:
+            leg.description = _key(leg.description)
+            for subleg in leg.sublegs:
+                subleg.description = _key(subleg.description)
+
+        if self.missions.get(mission.mission_id) != strings:
+            self.missions[mission.mission_id] = strings
+            self.is_dirty = True
+
+    def retain(self, mission_ids: Iterable[str]):
+        """Drops the strings of the missions no longer in the pack."""
+        mission_ids = set(mission_ids)
+        for mission_id in [mission_id for mission_id in self.missions if mission_id not in mission_ids]:
+            del self.missions[mission_id]
+            self.is_dirty = True
+
+    @property
+    def strings(self) -> Dict[str, str]:
+        return dict(sorted((key, text) for strings in self.missions.values() for (key, text) in strings.items()))
+
+    async def save(self):
+        if not self.is_dirty and await self.loc_pak_file.is_file():
+            return
+        await self.loc_pak_file.parent.mkdir(parents=True, exist_ok=True)
+        await self.loc_pak_file.write_text(json.dumps({'LocalisationPackage': {'Language': self.language,
+                                                                               'Strings': self.strings}},
+                                                      indent=2, ensure_ascii=False),
+                                           encoding='utf-8')
+        await self.table_file.parent.mkdir(parents=True, exist_ok=True)
+        await self.table_file.write_text(json.dumps({'version': STRING_TABLE_FORMAT_VERSION,
+                                                     'missions': self.missions},
+                                                    indent=2, sort_keys=True, ensure_ascii=False),
+                                         encoding='utf-8')
+        self.is_dirty = False
+
+
+async def load_string_table(table_file: Path, loc_pak_file: Path, *, prefix: str,
+                            language: str = DEFAULT_LANGUAGE) -> StringTable:
+    try:
+        content = json.loads(await table_file.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return StringTable(table_file, loc_pak_file, prefix=prefix, language=language)
+
+    if content.get('version') != STRING_TABLE_FORMAT_VERSION:
+        return StringTable(table_file, loc_pak_file, prefix=prefix, language=language)
+    return StringTable(table_file, loc_pak_file, prefix=prefix, language=language, missions=content.get('missions'))
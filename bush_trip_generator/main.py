@@ -1,17 +1,75 @@
+import contextlib
+import functools
+import time
 import trio
 
-from bush_trip_generator.mission import load_mission
-from trio import Path
+from bush_trip_generator import tracing
+from bush_trip_generator.airports import AirportDatabase
+from bush_trip_generator.config import parse_sys_args
+from bush_trip_generator.fspackagetool import package_projects
+from bush_trip_generator.pack import open_pack_builder, print_summary
+from bush_trip_generator.sources import ZipPath, open_source
+from bush_trip_generator.watch import PackWatcher
+from configargparse import Namespace
 
 
 # TODO: image path : check if ok with slash instead of backslash
 # TODO: formatting the xml => beautiful soup
 
-async def main():
-    mission = await load_mission(Path(__file__).parent.parent /
-                                 'bush_trips' / 'sources' / 'example_mission_pack' / 'example_mission_1')
-    await (Path(__file__).parent.parent / 'tmp' / 'example_mission_1.xml').write_text(mission.dump())
+async def package(settings: Namespace, *_, incremental: bool = None) -> bool:
+    results = await package_projects(settings, incremental=incremental)
+    for result in results:
+        print(result)
+    return all(result.ok for result in results)
+
+
+async def main(settings: Namespace):
+    if settings.trace:
+        tracing.enable_tracing()
+    try:
+        await build(settings)
+    finally:
+        if settings.trace:
+            tracing.TRACER.export(settings.trace)
+            print(tracing.TRACER.summary(settings.trace_top))
+
+
+async def build(settings: Namespace):
+    start = time.perf_counter()
+    pack_dir = await open_source(settings.source_dir)
+    if settings.watch and isinstance(pack_dir, ZipPath):
+        raise SystemExit('--watch requires a source directory, not a zip archive')
+    with AirportDatabase(settings.airport_db) if settings.airport_db else contextlib.nullcontext() as airports:
+        async with open_pack_builder(settings.out_dir,
+                                     jobs=settings.jobs,
+                                     processes=settings.processes,
+                                     cache_file=(settings.tmp_dir or settings.out_dir) / '.bush_trip_cache.json',
+                                     rebuild=settings.rebuild,
+                                     optimize_images=settings.optimize_images,
+                                     snapshot_file=settings.snapshot,
+                                     airports=airports,
+                                     aircraft_range=settings.aircraft_range,
+                                     cruise_speed=settings.cruise_speed,
+                                     navlog=settings.navlog,
+                                     strings_file=((settings.tmp_dir or settings.out_dir) / '.bush_trip_strings.json'
+                                                   if settings.localize else None),
+                                     loc_prefix=settings.pack_name,
+                                     loc_language=settings.loc_language) as builder:
+            results = await builder.build_pack(pack_dir)
+            print_summary(results, time.perf_counter() - start)
+            if any(not result.ok for result in results) and not settings.watch:
+                raise SystemExit(1)
+
+            if settings.project and (settings.rebuild or not all(result.skipped for result in results)):
+                if not await package(settings) and not settings.watch:
+                    raise SystemExit(1)
+
+            if settings.watch:
+                await PackWatcher(settings.source_dir, builder,
+                                  # --rebuild only applies to the initial build: edits are packaged incrementally
+                                  on_rebuilt=(functools.partial(package, settings, incremental=True)
+                                              if settings.project else None)).run()
 
 
 if __name__ == '__main__':
-    trio.run(main)
+    trio.run(main, parse_sys_args())
@@ -1,37 +1,37 @@
 from __future__ import annotations  # Allow forward reference type annotation in py3.8
 
 import bush_trip_generator.leg
-import uuid
+import fnmatch
+import functools
 import json
+import os
+import trio
 import typing
 
+from bush_trip_generator.concurrency import default_limiter
+from bush_trip_generator.flightplan import derive_legs, load_flight_plan
 from bush_trip_generator.leg import Leg
+from bush_trip_generator.sources import list_source_dir, natural_key, read_source_text
+from bush_trip_generator.tracing import span
 from bush_trip_generator.subleg import ICAOSubLeg
+from bush_trip_generator.template import Template
+from bush_trip_generator.uuids import format_uuid, instance_uuid_bytes
 from trio import Path
 
 if typing.TYPE_CHECKING:
-    from typing import List
+    from trio import CapacityLimiter
+    from bush_trip_generator.leg import LegCache, LegSources
+    from typing import Iterator, List, Sequence, Tuple
 
-
-class Mission:
-    def __init__(self, mission_id: str, title: str, description: str, initial_fix: str, legs: List[Leg]):
-        self.mission_id = mission_id
-        self.uuid = f"{{{str(uuid.uuid1()).upper()}}}"
-        self.title = title
-        self.description = description
-        self.initial_leg = Leg(sublegs=[ICAOSubLeg(wpt_id=initial_fix)])
-        self.legs = legs
-
-    def dump(self) -> str:
-        return f"""<?xml version="1.0" encoding="Windows-1252"?>
-<SimBase.Document Type="MissionFile" version="1,0" id="{self.mission_id}">
-  <Title>{self.title}</Title>
-  <Filename>{self.mission_id}.spb</Filename>
+MISSION_TEMPLATE = Template("""<?xml version="1.0" encoding="Windows-1252"?>
+<SimBase.Document Type="MissionFile" version="1,0" id="{mission_id}">
+  <Title>{title}</Title>
+  <Filename>{mission_id}.spb</Filename>
   <WorldBase.Flight InstanceId="{{9104F8D7-DC5B-453D-A7A4-6FE64834CF9A}}">
-    <SimMission.MissionBushTrip InstanceId="{self.uuid}" id="{self.mission_id}">
-      <Descr>{self.description}</Descr>
+    <SimMission.MissionBushTrip InstanceId="{uuid}" id="{mission_id}">
+      <Descr>{description}</Descr>
       <Legs>
-        {self._dump_legs()}
+        {legs}
       </Legs>
       <Objectives>
         <Objective UniqueRefId="{{37569C05-B09F-493B-A2C3-2BF1A8215E2E}}">
@@ -43,7 +43,7 @@ class Mission:
         <WorldBase.ObjectReference id="End Of Mission" InstanceId="{{1AA91671-30AD-4A5C-8DEF-7D80C558EBDC}}" />
       </OnFinishedActions>
     </SimMission.MissionBushTrip>
-    {self._dump_leg_completion_triggers()}
+    {leg_completion_triggers}
     <SimMission.Goal InstanceId="{{37569C05-B09F-493B-A2C3-2BF1A8215E2E}}">
       <Descr>End of mission</Descr>
       <Activated>false</Activated>
@@ -230,21 +230,127 @@ class Mission:
     </SimMission.FlowStateWise>
   </WorldBase.Flight>
 </SimBase.Document>
-"""
+""")
+
+
+class Mission:
+    __slots__ = ('mission_id', '_uuid', 'title', 'description', 'initial_leg', 'legs')
+
+    def __init__(self, mission_id: str, title: str, description: str, initial_fix: str, legs: Sequence[Leg]):
+        self.mission_id = mission_id
+        self._uuid = instance_uuid_bytes(mission_id, 'mission')
+        self.title = title
+        self.description = description
+        self.initial_leg = Leg(sublegs=[ICAOSubLeg(wpt_id=initial_fix)], mission_id=mission_id)
+        self.legs = legs
+
+    @property
+    def uuid(self) -> str:
+        return format_uuid(self._uuid)
+
+    def dump(self) -> bytes:
+        return b''.join(self.iter_dump())
+
+    def iter_dump(self) -> Iterator[bytes]:
+        return MISSION_TEMPLATE.render(mission_id=self.mission_id,
+                                       title=self.title,
+                                       uuid=self.uuid,
+                                       description=self.description,
+                                       legs=self._iter_dump_legs(),
+                                       leg_completion_triggers=self._iter_dump_leg_completion_triggers())
+
+    def _iter_dump_legs(self) -> Iterator[bytes]:
+        for (i, (prev, leg)) in enumerate(zip([self.initial_leg] + self.legs[:-1],
+                                              self.legs)):
+            if i:
+                yield b'\n'
+            yield leg.dump(prev=prev)
+
+    def _iter_dump_leg_completion_triggers(self) -> Iterator[bytes]:
+        for (i, leg) in enumerate(self.legs):
+            if i:
+                yield b'\n'
+            yield leg.dump_leg_completion_trigger()
+
+
+def write_mission_file(mission: Mission, output: str, *, buffer_size: int = 1 << 16):
+    """Streams the mission document to the output file, without ever holding the whole document in memory."""
+    with span('render and write', 'render', mission=mission.mission_id):
+        with open(output, 'wb', buffering=buffer_size) as f:
+            f.writelines(mission.iter_dump())
+
+
+async def write_mission(mission: Mission, output: Path, *, limiter: CapacityLimiter = None):
+    await trio.to_thread.run_sync(write_mission_file, mission, os.fspath(output), limiter=limiter)
+
+
+def scan_mission_header(source_dir: Path) -> Tuple[str, bool, List[Path]]:
+    """Reads the metadata of a mission, and lists its legs sorted by leg number (blocking).
+
+    Returns the metadata text, whether the mission has a flight plan, and the source directory of each leg.
+    """
+    entries = list_source_dir(source_dir)
+    metadata = read_source_text(source_dir / f'{source_dir.name}.json')
+    leg_source_dirs = [source_dir / name for name in sorted(fnmatch.filter(entries, 'leg_*'), key=natural_key)
+                       if entries[name]]
+    return metadata, entries.get(f'{source_dir.name}.pln') is False, leg_source_dirs
+
+
+def scan_mission(source_dir: Path, *, lazy_descriptions: bool = False) -> Tuple[str, bool, List[LegSources]]:
+    """Reads the metadata and the leg sources of a mission, sorted by leg number, in a single pass (blocking)."""
+    (metadata, has_flight_plan, leg_source_dirs) = scan_mission_header(source_dir)
+    return (metadata,
+            has_flight_plan,
+            [bush_trip_generator.leg.scan_leg(leg_source_dir, lazy_description=lazy_descriptions)
+             for leg_source_dir in leg_source_dirs])
+
+
+def parse_mission(source_dir: Path, metadata: str, leg_sources: List[LegSources], *,
+                  lazy_descriptions: bool = False) -> Mission:
+    """Builds a mission from the metadata and leg sources read by scan_mission()."""
+    return Mission(mission_id=source_dir.name,
+                   legs=[bush_trip_generator.leg.parse_leg(leg_source, lazy_descriptions=lazy_descriptions)
+                         for leg_source in leg_sources],
+                   **json.loads(metadata))
+
+
+async def load_mission(source_dir: Path, *, limiter: CapacityLimiter = None,
+                       lazy_descriptions: bool = False) -> Mission:
+    """Loads a mission from its sources, read in a single worker thread call.
+
+    Lazy descriptions of legs and sublegs are read again when rendered.
+    """
+    limiter = limiter or default_limiter()
+
+    with span('scan mission', 'io', mission=source_dir.name):
+        (metadata, has_flight_plan, leg_sources) = await trio.to_thread.run_sync(
+            functools.partial(scan_mission, source_dir, lazy_descriptions=lazy_descriptions), limiter=limiter)
+
+    if not leg_sources and has_flight_plan:
+        # Without any leg sources, legs are derived from the mission's flight plan
+        async with limiter:
+            plan = await load_flight_plan(source_dir / f'{source_dir.name}.pln')
+        return Mission(mission_id=source_dir.name,
+                       legs=derive_legs(plan, mission_id=source_dir.name),
+                       **json.loads(metadata))
+
+    with span('parse mission', 'parse', mission=source_dir.name):
+        return parse_mission(source_dir, metadata, leg_sources, lazy_descriptions=lazy_descriptions)
 
-    def _dump_legs(self) -> str:
-        return '\n'.join([leg.dump(prev=prev)
-                          for (prev, leg) in zip([self.initial_leg] + self.legs[:-1],
-                                                 self.legs)])
 
-    def _dump_leg_completion_triggers(self) -> str:
-        return '\n'.join([leg.dump_leg_completion_trigger()
-                          for leg in self.legs])
+async def load_mission_header(source_dir: Path, *, limiter: CapacityLimiter = None, leg_cache: LegCache = None,
+                              lazy_descriptions: bool = False) -> Mission:
+    """Loads the metadata of a mission only, for catalogue operations: its legs are loaded on first access through
+    the leg cache (see LazyLegs), which bounds the memory used by any number of missions.
 
+    Missions without leg sources are loaded whole, as their legs are derived from their flight plan.
+    """
+    with span('scan mission header', 'io', mission=source_dir.name):
+        (metadata, has_flight_plan, leg_source_dirs) = await trio.to_thread.run_sync(
+            scan_mission_header, source_dir, limiter=limiter or default_limiter())
 
-async def load_mission(source_dir: Path) -> Mission:
-    metadata = json.loads(await (source_dir / f'{source_dir.name}.json').read_text())
+    if not leg_source_dirs and has_flight_plan:
+        return await load_mission(source_dir, limiter=limiter, lazy_descriptions=lazy_descriptions)
     return Mission(mission_id=source_dir.name,
-                   legs=[await bush_trip_generator.leg.load_leg(leg_source_dir)
-                         for leg_source_dir in await source_dir.glob('leg_*')],
-                   **metadata)
+                   legs=bush_trip_generator.leg.LazyLegs(leg_source_dirs, leg_cache, lazy_descriptions),
+                   **json.loads(metadata))
@@ -0,0 +1,257 @@
+"""Navigation log of missions: great-circle distance, initial course and estimated time enroute of every subleg and leg.
+
+Usage: python -m bush_trip_generator.navlog <source_dir> [--airport-db INDEX] [--aircraft-range NM] [--cruise-speed KT]
+
+Waypoint positions come from the missions' flight plans, and from the airport index for airports missing from them.
+The navlog of any number of missions is computed in a single vectorized pass, with NumPy when it is installed.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import bush_trip_generator.pack
+import configargparse
+import contextlib
+import functools
+import math
+import time
+import trio
+
+from bush_trip_generator.airports import AirportDatabase
+from bush_trip_generator.concurrency import gather
+from bush_trip_generator.flightplan import load_flight_plan
+from bush_trip_generator.mission import load_mission
+from bush_trip_generator.sources import open_source
+from bush_trip_generator.tracing import span
+from typing import TYPE_CHECKING
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional: without it, the same computations run element by element
+    numpy = None
+
+if TYPE_CHECKING:
+    from bush_trip_generator.flightplan import FlightPlan
+    from bush_trip_generator.mission import Mission
+    from trio import Path
+    from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+    Position = Tuple[float, float]
+    Route = List[List[Optional[Position]]]
+
+EARTH_RADIUS_NM = 3440.065
+DEFAULT_CRUISE_SPEED = 120.0
+
+
+def great_circle(lat1: Sequence[float], lon1: Sequence[float], lat2: Sequence[float], lon2: Sequence[float]
+                 ) -> Tuple[Sequence[float], Sequence[float]]:
+    """Distances (in nautical miles) and initial true courses (in degrees) between pairs of positions in degrees."""
+    if numpy is not None:
+        (phi1, lambda1, phi2, lambda2) = (numpy.radians(numpy.asarray(values, dtype=float))
+                                          for values in (lat1, lon1, lat2, lon2))
+        delta_lambda = lambda2 - lambda1
+        a = (numpy.sin((phi2 - phi1) / 2) ** 2 +
+             numpy.cos(phi1) * numpy.cos(phi2) * numpy.sin(delta_lambda / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_NM * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
+        courses = numpy.degrees(numpy.arctan2(numpy.sin(delta_lambda) * numpy.cos(phi2),
+                                              numpy.cos(phi1) * numpy.sin(phi2) -
+                                              numpy.sin(phi1) * numpy.cos(phi2) * numpy.cos(delta_lambda))) % 360
+        return distances, courses
+
+    distances = list()
+    courses = list()
+    for (phi1, lambda1, phi2, lambda2) in zip(*((math.radians(value) for value in values)
+                                                for values in (lat1, lon1, lat2, lon2))):
+        delta_lambda = lambda2 - lambda1
+        a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_NM * math.asin(math.sqrt(min(max(a, 0.0), 1.0))))
+        courses.append(math.degrees(math.atan2(math.sin(delta_lambda) * math.cos(phi2),
+                                               math.cos(phi1) * math.sin(phi2) -
+                                               math.sin(phi1) * math.cos(phi2) * math.cos(delta_lambda))) % 360)
+    return distances, courses
+
+
+class NavlogEntry:
+    def __init__(self, distance: float, course: float, ete: float):
+        self.distance = distance
+        self.course = course
+        self.ete = ete  # Hours
+
+    @property
+    def is_known(self) -> bool:
+        return not math.isnan(self.distance)
+
+    def __str__(self) -> str:
+        if not self.is_known:
+            return 'unknown position'
+        minutes = round(self.ete * 60)
+        return f'{self.distance:.1f} nm, course {self.course:03.0f}°, ETE {minutes // 60}:{minutes % 60:02d}'
+
+
+class LegNavlog:
+    def __init__(self, leg_index: int, total: NavlogEntry, sublegs: List[NavlogEntry]):
+        self.leg_index = leg_index
+        self.total = total
+        self.sublegs = sublegs
+
+
+def mission_route(mission: Mission, plan: FlightPlan = None, airports: AirportDatabase = None) -> Route:
+    """Positions of the initial fix, followed by those of each leg's sublegs (None where unknown)."""
+    occurrences = dict()
+
+    def _position(wpt_id: str) -> Optional[Position]:
+        waypoint = None
+        if plan is not None and wpt_id in plan.by_icao:
+            waypoint = plan.by_icao[wpt_id]
+        elif plan is not None and wpt_id in plan.by_id:
+            # User waypoints may share an id: the n-th one of the mission is the n-th one of the flight plan
+            waypoints = plan.by_id[wpt_id]
+            occurrences[wpt_id] = occurrences.get(wpt_id, -1) + 1
+            waypoint = waypoints[min(occurrences[wpt_id], len(waypoints) - 1)]
+        if waypoint is not None:
+            return waypoint.latitude, waypoint.longitude
+        if airports is not None:
+            return airports.find(wpt_id)
+
+    return ([[_position(mission.initial_leg.last_subleg.wpt_id)]] +
+            [[_position(subleg.wpt_id) for subleg in leg.sublegs] for leg in mission.legs])
+
+
+def compute_navlogs(routes: List[Route], *, cruise_speed: float = DEFAULT_CRUISE_SPEED) -> List[List[LegNavlog]]:
+    """Navlogs of many missions, whose sublegs and legs are all computed by a single call to great_circle()."""
+    unknown = (math.nan, math.nan)
+    (lat1, lon1, lat2, lon2) = (list(), list(), list(), list())
+
+    def _segment(start: Optional[Position], end: Optional[Position]):
+        (start, end) = (start or unknown, end or unknown)
+        lat1.append(start[0])
+        lon1.append(start[1])
+        lat2.append(end[0])
+        lon2.append(end[1])
+
+    # Flatten the sublegs of every leg of every mission, followed by the legs (from their start to their end)
+    legs = list()
+    for (initial_fix, *route_legs) in routes:
+        start = initial_fix[0]
+        for positions in route_legs:
+            for (prev, position) in zip([start] + positions[:-1], positions):
+                _segment(prev, position)
+            legs.append((start, positions[-1] if positions else start, len(positions)))
+            start = legs[-1][1]
+    for (start, end, _) in legs:
+        _segment(start, end)
+
+    (distances, courses) = great_circle(lat1, lon1, lat2, lon2)
+    if numpy is not None:
+        (distances, courses) = (distances.tolist(), courses.tolist())
+
+    navlogs = list()
+    (i, j) = (0, 0)
+    leg_offset = len(lat1) - len(legs)
+    for (_, *route_legs) in routes:
+        navlog = list()
+        for leg_index in range(len(route_legs)):
+            count = legs[j][2]
+            sublegs = [NavlogEntry(distances[k], courses[k], distances[k] / cruise_speed) for k in range(i, i + count)]
+            # Legs are flown along their sublegs: their distance is the sum of the sublegs', not the direct one
+            distance = math.fsum(subleg.distance for subleg in sublegs)
+            navlog.append(LegNavlog(leg_index,
+                                    NavlogEntry(distance, courses[leg_offset + j], distance / cruise_speed),
+                                    sublegs))
+            (i, j) = (i + count, j + 1)
+        navlogs.append(navlog)
+    return navlogs
+
+
+class NavlogBatch:
+    """Navlogs of the missions of a pack build, computed together by a single call to compute_navlogs() once every
+    mission has either submitted its route or been discarded (skipped, or failed before)."""
+
+    def __init__(self, mission_ids: Iterable[str], *, cruise_speed: float = DEFAULT_CRUISE_SPEED):
+        self.cruise_speed = cruise_speed
+        self.pending = set(mission_ids)
+        self.routes: Dict[str, Route] = dict()
+        self.navlogs: Dict[str, List[LegNavlog]] = dict()
+        self.done = trio.Event()
+
+    def _settle(self):
+        if not self.pending and not self.done.is_set():
+            with span('navlog', 'build', missions=len(self.routes)):
+                self.navlogs = dict(zip(self.routes, compute_navlogs(list(self.routes.values()),
+                                                                     cruise_speed=self.cruise_speed)))
+            self.done.set()
+
+    async def compute(self, mission_id: str, route: Route) -> List[LegNavlog]:
+        if mission_id not in self.pending:
+            # Not part of the batch
+            (navlog,) = compute_navlogs([route], cruise_speed=self.cruise_speed)
+            return navlog
+        self.pending.remove(mission_id)
+        self.routes[mission_id] = route
+        self._settle()
+        await self.done.wait()
+        return self.navlogs[mission_id]
+
+    def discard(self, mission_id: str):
+        self.pending.discard(mission_id)
+        self._settle()
+
+
+def check_range(mission: Mission, navlog: List[LegNavlog], aircraft_range: float) -> List[str]:
+    """Lists the legs of the mission longer than the aircraft range, or whose length is unknown."""
+    warnings = list()
+    for (leg, leg_navlog) in zip(mission.legs, navlog):
+        if not leg_navlog.total.is_known:
+            warnings.append(f'Leg {leg.leg_index + 1}: unknown length, missing waypoint positions')
+        elif leg_navlog.total.distance > aircraft_range:
+            warnings.append(f'Leg {leg.leg_index + 1}: {leg_navlog.total.distance:.0f} nm exceeds the aircraft range '
+                            f'of {aircraft_range:.0f} nm')
+    return warnings
+
+
+def fill_descriptions(mission: Mission, navlog: List[LegNavlog]):
+    """Appends the navlog of each leg to its description."""
+    for (leg, leg_navlog) in zip(mission.legs, navlog):
+        if leg_navlog.total.is_known:
+            leg.description = f'{leg.description.rstrip()}\n\nNavlog: {leg_navlog.total}'
+
+
+async def load_routes(pack_dir: Path, *, airports: AirportDatabase = None) -> Tuple[List[Mission], List[Route]]:
+    async def _load(mission_dir: Path) -> Tuple[Mission, Route]:
+        mission = await load_mission(mission_dir, lazy_descriptions=True)
+        plan_file = mission_dir / f'{mission_dir.name}.pln'
+        plan = await load_flight_plan(plan_file) if await plan_file.is_file() else None
+        return mission, mission_route(mission, plan, airports)
+
+    loaded = await gather(functools.partial(_load, mission_dir)
+                          for mission_dir in await bush_trip_generator.pack.find_missions(await open_source(pack_dir)))
+    return [mission for (mission, _) in loaded], [route for (_, route) in loaded]
+
+
+def main():
+    parser = configargparse.Parser(description='Computes the navigation log of the missions of a pack')
+    parser.add_argument('source_dir')
+    parser.add_argument('--airport-db', required=False)
+    parser.add_argument('--aircraft-range', type=float, default=None)
+    parser.add_argument('--cruise-speed', type=float, default=DEFAULT_CRUISE_SPEED)
+    args = parser.parse_args()
+
+    with AirportDatabase(args.airport_db) if args.airport_db else contextlib.nullcontext() as airports:
+        (missions, routes) = trio.run(functools.partial(load_routes, trio.Path(args.source_dir), airports=airports))
+    start = time.perf_counter()
+    navlogs = compute_navlogs(routes, cruise_speed=args.cruise_speed)
+    elapsed = time.perf_counter() - start
+
+    for (mission, navlog) in zip(missions, navlogs):
+        print(mission.mission_id)
+        for leg_navlog in navlog:
+            print(f'  Leg {leg_navlog.leg_index + 1:<3} {leg_navlog.total}')
+            for (i, subleg) in enumerate(leg_navlog.sublegs):
+                print(f'    {i + 1:<3} {subleg}')
+        if args.aircraft_range is not None:
+            for warning in check_range(mission, navlog, args.aircraft_range):
+                print(f'  warning: {warning}')
+    waypoints = sum(len(positions) for route in routes for positions in route)
+    print(f'{waypoints} waypoints of {len(missions)} missions computed in {elapsed:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import bush_trip_generator.navlog
+import contextlib
+import json
+import os
+import time
+import trio
+
+from bush_trip_generator.airports import validate_mission
+from bush_trip_generator.cache import BuildCache, load_build_cache
+from bush_trip_generator.concurrency import default_limiter, gather, process_pool, run_in_executor
+from bush_trip_generator.flightplan import cross_check, load_flight_plan
+from bush_trip_generator.images import ImageOptimizer
+from bush_trip_generator.localization import DEFAULT_LANGUAGE, StringTable, load_string_table
+from bush_trip_generator.mission import load_mission, write_mission, write_mission_file
+from bush_trip_generator.snapshot import load_pack_snapshot
+from bush_trip_generator.sources import list_source_dir, natural_key
+from bush_trip_generator.tracing import span
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bush_trip_generator.airports import AirportDatabase
+    from bush_trip_generator.mission import Mission
+    from bush_trip_generator.snapshot import PackSnapshot
+    from concurrent.futures import Executor
+    from trio import Path
+    from typing import AsyncIterator, List, Optional
+
+
+def scan_missions(pack_dir: Path) -> List[Path]:
+    """Directories of the missions of the pack, sorted by name and number (blocking)."""
+    entries = list_source_dir(pack_dir)
+    return [pack_dir / name
+            for name in sorted(entries, key=natural_key)
+            if entries[name] and list_source_dir(pack_dir / name).get(f'{name}.json') is False]
+
+
+async def find_missions(pack_dir: Path) -> List[Path]:
+    return await trio.to_thread.run_sync(scan_missions, pack_dir)
+
+
+class MissionBuildResult:
+    def __init__(self, mission_id: str, *, output: Path = None, duration: float = 0.0, error: Exception = None,
+                 skipped: bool = False, warnings: List[str] = None):
+        self.mission_id = mission_id
+        self.output = output
+        self.duration = duration
+        self.error = error
+        self.skipped = skipped
+        self.warnings = warnings or list()
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __str__(self) -> str:
+        status = 'up to date' if self.skipped else 'ok' if self.ok else f'FAILED: {self.error}'
+        return '\n'.join([f'{self.mission_id:<40} {self.duration:8.3f}s  {status}'] +
+                         [f'    warning: {warning}' for warning in self.warnings])
+
+
+class PackBuilder:
+    def __init__(self, out_dir: Path, *, jobs: int = None, executor: Executor = None, cache: BuildCache = None,
+                 optimize_images: bool = False, snapshot: PackSnapshot = None, airports: AirportDatabase = None,
+                 lazy_descriptions: bool = False, aircraft_range: float = None,
+                 cruise_speed: float = None, navlog: bool = False, strings: StringTable = None):
+        self.out_dir = out_dir
+        self.limiter = trio.CapacityLimiter(jobs) if jobs else default_limiter()
+        self.executor = executor
+        self.cache = cache
+        self.images = ImageOptimizer(out_dir, executor=executor, limiter=self.limiter) if optimize_images else None
+        self.snapshot = snapshot
+        self.airports = airports
+        self.lazy_descriptions = lazy_descriptions
+        self.aircraft_range = aircraft_range
+        self.cruise_speed = cruise_speed or bush_trip_generator.navlog.DEFAULT_CRUISE_SPEED
+        self.navlog = navlog
+        self.strings = strings
+        self.navlogs: Optional[bush_trip_generator.navlog.NavlogBatch] = None  # Set while building a pack
+
+    @property
+    def options(self) -> str:
+        """Fingerprint of the build options changing the rendered missions, part of their cache key."""
+        options = dict()
+        if self.images is not None:
+            options['images'] = self.images.options
+        if self.airports is not None:
+            options['airports'] = self.airports.identity
+        if self.aircraft_range is not None or self.navlog:
+            options['navlog'] = [self.aircraft_range, self.cruise_speed, self.navlog]
+        if self.strings is not None:
+            options['strings'] = [self.strings.prefix, self.strings.language]
+        return json.dumps(options, sort_keys=True)
+
+    async def write(self, mission: Mission, output: Path):
+        with span('write mission', 'build', mission=mission.mission_id):
+            if self.executor is None:
+                await write_mission(mission, output, limiter=self.limiter)
+            else:
+                await run_in_executor(self.executor, write_mission_file, mission, os.fspath(output))
+
+    async def load(self, source_dir: Path) -> Mission:
+        with span('load mission', 'build', mission=source_dir.name):
+            return await self._load(source_dir)
+
+    async def _load(self, source_dir: Path) -> Mission:
+        if self.snapshot is None:
+            return await load_mission(source_dir, limiter=self.limiter, lazy_descriptions=self.lazy_descriptions)
+
+        signature = await self.snapshot.signature(source_dir, limiter=self.limiter)
+        mission = self.snapshot.get(source_dir.name, signature)
+        if mission is None:
+            mission = await load_mission(source_dir, limiter=self.limiter, lazy_descriptions=self.lazy_descriptions)
+            self.snapshot.put(source_dir.name, signature, mission)
+        return mission
+
+    async def check(self, source_dir: Path, mission: Mission) -> List[str]:
+        flight_plan_file = source_dir / f'{source_dir.name}.pln'
+        plan = None
+        if await flight_plan_file.is_file():
+            async with self.limiter:
+                with span('load flight plan', 'io', mission=source_dir.name):
+                    plan = await load_flight_plan(flight_plan_file)
+        warnings = cross_check(mission, plan) if plan is not None else list()
+
+        if self.aircraft_range is not None or self.navlog:
+            navlog = bush_trip_generator.navlog
+            route = navlog.mission_route(mission, plan, self.airports)
+            if self.navlogs is not None:
+                # Computed with the other missions of the pack, in a single pass
+                mission_navlog = await self.navlogs.compute(source_dir.name, route)
+            else:
+                with span('navlog', 'build', mission=source_dir.name):
+                    (mission_navlog,) = navlog.compute_navlogs([route], cruise_speed=self.cruise_speed)
+            if self.aircraft_range is not None:
+                warnings.extend(navlog.check_range(mission, mission_navlog, self.aircraft_range))
+            if self.navlog:
+                navlog.fill_descriptions(mission, mission_navlog)
+        return warnings
+
+    async def build_mission(self, source_dir: Path, *, mission: Mission = None) -> MissionBuildResult:
+        """Builds the mission from its sources, or renders the given, already loaded, mission model."""
+        with span(source_dir.name, 'mission'):
+            try:
+                return await self._build_mission(source_dir, mission=mission)
+            finally:
+                if self.navlogs is not None:
+                    self.navlogs.discard(source_dir.name)
+
+    async def _build_mission(self, source_dir: Path, *, mission: Mission = None) -> MissionBuildResult:
+        start = time.perf_counter()
+        output = self.out_dir / f'{source_dir.name}.xml'
+        digest = None
+        warnings = list()
+        try:
+            if mission is None:
+                if self.cache is not None:
+                    with span('hash sources', 'build', mission=source_dir.name):
+                        digest = await self.cache.source_digest(source_dir, options=self.options,
+                                                               limiter=self.limiter)
+                    # Missions missing from the string table are built again to put their strings back in it
+                    if (await self.cache.is_up_to_date(source_dir.name, digest, output) and
+                            (self.strings is None or source_dir.name in self.strings.missions)):
+                        return MissionBuildResult(source_dir.name, output=output,
+                                                  duration=time.perf_counter() - start, skipped=True)
+
+                mission = await self.load(source_dir)
+            warnings = await self.check(source_dir, mission)
+            if self.airports is not None and (errors := validate_mission(mission, self.airports)):
+                raise ValueError('\n'.join(errors))
+            if self.images is not None:
+                with span('optimize images', 'build', mission=source_dir.name):
+                    await self.images.optimize_mission(mission)
+            if self.strings is not None:
+                with span('localize', 'build', mission=source_dir.name):
+                    self.strings.localize(mission)
+            await self.write(mission, output)
+        except Exception as e:
+            if self.cache is not None:
+                self.cache.update(source_dir.name, None)
+            return MissionBuildResult(source_dir.name, duration=time.perf_counter() - start, error=e,
+                                      warnings=warnings)
+
+        if self.cache is not None:
+            self.cache.update(source_dir.name, digest)
+        return MissionBuildResult(source_dir.name, output=output, duration=time.perf_counter() - start,
+                                  warnings=warnings)
+
+    async def build_pack(self, pack_dir: Path) -> List[MissionBuildResult]:
+        await self.out_dir.mkdir(parents=True, exist_ok=True)
+        mission_dirs = await find_missions(pack_dir)
+        if self.aircraft_range is not None or self.navlog:
+            self.navlogs = bush_trip_generator.navlog.NavlogBatch((mission_dir.name for mission_dir in mission_dirs),
+                                                                  cruise_speed=self.cruise_speed)
+        try:
+            results = await gather(lambda mission_dir=mission_dir: self.build_mission(mission_dir)
+                                   for mission_dir in mission_dirs)
+        finally:
+            self.navlogs = None
+        if self.cache is not None:
+            await self.cache.save()
+        if self.snapshot is not None:
+            await self.snapshot.save()
+        if self.strings is not None:
+            self.strings.retain(mission_dir.name for mission_dir in mission_dirs)
+            await self.strings.save()
+        return results
+
+
+@contextlib.asynccontextmanager
+async def open_pack_builder(out_dir: Path, *, jobs: int = None, processes: Optional[int] = 0, cache_file: Path = None,
+                            rebuild: bool = False, optimize_images: bool = False, snapshot_file: Path = None,
+                            airports: AirportDatabase = None, aircraft_range: float = None,
+                            cruise_speed: float = None, navlog: bool = False, strings_file: Path = None,
+                            loc_prefix: str = None,
+                            loc_language: str = DEFAULT_LANGUAGE) -> AsyncIterator[PackBuilder]:
+    cache = None
+    if cache_file:
+        cache = BuildCache(cache_file) if rebuild else await load_build_cache(cache_file)
+    snapshot = await load_pack_snapshot(snapshot_file) if snapshot_file else None
+    strings = None
+    if strings_file:
+        loc_pak_file = out_dir / f'{loc_language}.locPak'
+        strings = (StringTable(strings_file, loc_pak_file, prefix=loc_prefix, language=loc_language) if rebuild
+                   else await load_string_table(strings_file, loc_pak_file, prefix=loc_prefix, language=loc_language))
+
+    with process_pool(processes) if processes != 0 else contextlib.nullcontext() as executor:
+        yield PackBuilder(out_dir, jobs=jobs, executor=executor, cache=cache, optimize_images=optimize_images,
+                          snapshot=snapshot, airports=airports, aircraft_range=aircraft_range,
+                          cruise_speed=cruise_speed, navlog=navlog, strings=strings)
+
+
+async def build_pack(pack_dir: Path, out_dir: Path, **kwargs) -> List[MissionBuildResult]:
+    async with open_pack_builder(out_dir, **kwargs) as builder:
+        return await builder.build_pack(pack_dir)
+
+
+def format_summary(results: List[MissionBuildResult], elapsed: float) -> str:
+    failures = [result for result in results if not result.ok]
+    skipped = [result for result in results if result.skipped]
+    return '\n'.join([str(result) for result in results] +
+                     [f'{len(results) - len(skipped) - len(failures)} missions built, {len(skipped)} up to date, '
+                      f'{len(failures)} failed in {elapsed:.3f}s'])
+
+
+def print_summary(results: List[MissionBuildResult], elapsed: float):
+    print(format_summary(results, elapsed))
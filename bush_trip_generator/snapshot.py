@@ -0,0 +1,79 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import os
+import pickle
+import trio
+
+from bush_trip_generator.cache import generator_digest
+from bush_trip_generator.sources import ZipPath
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from trio import CapacityLimiter, Path
+    from typing import Dict, Optional, Tuple
+
+    Signature = Tuple[Tuple[str, int, int], ...]
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def stat_signature(source_dir: str) -> Signature:
+    """(relative path, size, mtime) of every file of a mission source tree, in a stable order."""
+    signature = list()
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            stat = os.stat(os.path.join(dir_path, file_name))
+            signature.append((os.path.relpath(os.path.join(dir_path, file_name), source_dir).replace(os.sep, '/'),
+                              stat.st_size,
+                              stat.st_mtime_ns))
+    return tuple(signature)
+
+
+class PackSnapshot:
+    """Parsed missions of a pack, compiled into a single file and keyed by the stat signature of their sources.
+
+    Missions are kept pickled, so that each lookup returns a fresh model that the build stages can freely modify.
+    """
+
+    def __init__(self, snapshot_file: Path, entries: Dict[str, Tuple[Signature, bytes]] = None):
+        self.snapshot_file = snapshot_file
+        self.entries = entries or dict()
+        self.is_dirty = False
+
+    async def signature(self, source_dir: Path, *, limiter: CapacityLimiter = None) -> Signature:
+        if isinstance(source_dir, ZipPath):
+            return source_dir.signature()
+        return await trio.to_thread.run_sync(stat_signature, os.fspath(source_dir), limiter=limiter)
+
+    def get(self, mission_id: str, signature: Signature) -> Optional[Mission]:
+        if mission_id in self.entries:
+            (cached_signature, data) = self.entries[mission_id]
+            if cached_signature == signature:
+                return pickle.loads(data)
+
+    def put(self, mission_id: str, signature: Signature, mission: Mission):
+        self.entries[mission_id] = (signature, pickle.dumps(mission, protocol=pickle.HIGHEST_PROTOCOL))
+        self.is_dirty = True
+
+    async def save(self):
+        # Without a snapshot file, the snapshot only lives in memory (see bush_trip_generator.daemon)
+        if not self.is_dirty or self.snapshot_file is None:
+            return
+        await self.snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        await self.snapshot_file.write_bytes(pickle.dumps((SNAPSHOT_FORMAT_VERSION, generator_digest(), self.entries),
+                                                          protocol=pickle.HIGHEST_PROTOCOL))
+        self.is_dirty = False
+
+
+async def load_pack_snapshot(snapshot_file: Path) -> PackSnapshot:
+    try:
+        (version, digest, entries) = pickle.loads(await snapshot_file.read_bytes())
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        return PackSnapshot(snapshot_file)
+
+    # Pickled models are only valid for the generator code that produced them
+    if version != SNAPSHOT_FORMAT_VERSION or digest != generator_digest():
+        return PackSnapshot(snapshot_file)
+    return PackSnapshot(snapshot_file, entries)
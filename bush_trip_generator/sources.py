@@ -0,0 +1,239 @@
+"""Mission pack sources, read either from a directory or straight from a zip archive, without extracting it.
+
+Archives are memory-mapped: their central directory is parsed once, and entries are sliced out of the mapping and
+decompressed on read. ZipPath implements the subset of trio.Path used by the loaders, so that they read both kinds of
+sources alike.
+
+The loaders take a snapshot of each mission in a single worker thread call, with the blocking helpers below.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import fnmatch
+import io
+import locale
+import mmap
+import os
+import posixpath
+import re
+import struct
+import threading
+import trio
+import zipfile
+import zlib
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from trio import Path
+    from typing import BinaryIO, Dict, List, Tuple, Union
+
+    Signature = Tuple[Tuple[str, int, int], ...]
+
+RE_DIGITS = re.compile(r'(\d+)')
+
+# Fixed size part of a local file header, followed by the file name and extra field, whose lengths end it
+LOCAL_HEADER = struct.Struct(zipfile.structFileHeader)
+
+
+class _MappedFile(io.RawIOBase):
+    """File object reading a memory map, as zipfile requires."""
+
+    def __init__(self, mapping: mmap.mmap):
+        self.mapping = mapping
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self.mapping.seek(offset, whence)
+        return self.mapping.tell()
+
+    def tell(self) -> int:
+        return self.mapping.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        return self.mapping.read(size if size is not None and size >= 0 else None)
+
+
+class ZipArchive:
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        with open(archive_path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.zip_file = zipfile.ZipFile(_MappedFile(self.mapping))
+        self.files: Dict[str, zipfile.ZipInfo] = dict()
+        self.children: Dict[str, Dict[str, bool]] = {'': dict()}  # Directory -> {child name: is a directory}
+        for info in self.zip_file.infolist():
+            name = info.filename.rstrip('/')
+            if info.is_dir():
+                self.children.setdefault(name, dict())
+            else:
+                self.files[name] = info
+            # Archives do not always list directories: they are implied by the paths of their entries
+            (child, is_dir) = (name, info.is_dir())
+            while child:
+                parent = posixpath.dirname(child)
+                self.children.setdefault(parent, dict())[posixpath.basename(child)] = is_dir
+                (child, is_dir) = (parent, True)
+
+    def read_bytes(self, name: str) -> bytes:
+        info = self.files[name]
+        if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or info.flag_bits & 0x1:
+            return self.zip_file.read(info)  # Other compressions and encryption are left to zipfile
+
+        # Slice the entry's data out of the mapping: no seek, so that threads can read entries concurrently
+        header = LOCAL_HEADER.unpack_from(self.mapping, info.header_offset)
+        if header[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f'Bad local file header of {name} in {self.archive_path}')
+        start = info.header_offset + LOCAL_HEADER.size + header[-2] + header[-1]
+        data = self.mapping[start:start + info.compress_size]
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        if zlib.crc32(data) != info.CRC:
+            raise zipfile.BadZipFile(f'Bad CRC-32 of {name} in {self.archive_path}')
+        return data
+
+    def read_text(self, name: str, encoding: str = None) -> str:
+        # Same decoding and newline translation as reading the extracted file in text mode
+        with io.TextIOWrapper(io.BytesIO(self.read_bytes(name)),
+                              encoding=encoding or locale.getpreferredencoding(False)) as f:
+            return f.read()
+
+    def signature(self, name: str) -> Signature:
+        """(relative path, size, CRC-32) of every file under a directory, taken from the central directory alone."""
+        prefix = f'{name}/' if name else ''
+        return tuple((file_name[len(prefix):], info.file_size, info.CRC)
+                     for (file_name, info) in sorted(self.files.items())
+                     if file_name.startswith(prefix))
+
+    def close(self):
+        self.zip_file.close()
+        self.mapping.close()
+
+
+_archives: Dict[str, Tuple[Tuple[int, int], ZipArchive]] = dict()
+_archives_lock = threading.Lock()
+
+
+def open_zip_archive(archive_path: str) -> ZipArchive:
+    """Opens the archive once per process, and again whenever it is modified."""
+    stat = os.stat(archive_path)
+    with _archives_lock:
+        (version, archive) = _archives.get(archive_path, (None, None))
+        if version != (stat.st_size, stat.st_mtime_ns):
+            archive = ZipArchive(archive_path)
+            _archives[archive_path] = ((stat.st_size, stat.st_mtime_ns), archive)
+        return archive
+
+
+class ZipPath:
+    """Path of a file or directory in a zip archive, with the same interface as trio.Path for the loaders."""
+
+    def __init__(self, archive_path: str, name: str = ''):
+        self.archive_path = archive_path
+        self.path = name.strip('/')
+
+    @property
+    def archive(self) -> ZipArchive:
+        return open_zip_archive(self.archive_path)
+
+    @property
+    def name(self) -> str:
+        return posixpath.basename(self.path)
+
+    @property
+    def suffix(self) -> str:
+        return posixpath.splitext(self.name)[1]
+
+    @property
+    def stem(self) -> str:
+        return posixpath.splitext(self.name)[0]
+
+    @property
+    def parent(self) -> ZipPath:
+        return ZipPath(self.archive_path, posixpath.dirname(self.path))
+
+    def __truediv__(self, other: str) -> ZipPath:
+        return ZipPath(self.archive_path, posixpath.join(self.path, other))
+
+    def __str__(self) -> str:
+        return f'{self.archive_path}!/{self.path}'
+
+    def __repr__(self) -> str:
+        return f'ZipPath({self.archive_path!r}, {self.path!r})'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ZipPath) and (self.archive_path, self.path) == (other.archive_path, other.path)
+
+    def __lt__(self, other: ZipPath) -> bool:
+        return (self.archive_path, self.path) < (other.archive_path, other.path)
+
+    def __hash__(self) -> int:
+        return hash((self.archive_path, self.path))
+
+    async def is_file(self) -> bool:
+        return self.path in self.archive.files
+
+    async def is_dir(self) -> bool:
+        return self.path in self.archive.children
+
+    async def exists(self) -> bool:
+        return await self.is_file() or await self.is_dir()
+
+    async def iterdir(self) -> List[ZipPath]:
+        return [self / name for name in self.archive.children.get(self.path, ())]
+
+    async def glob(self, pattern: str) -> List[ZipPath]:
+        return [self / name for name in fnmatch.filter(self.archive.children.get(self.path, ()), pattern)]
+
+    async def read_bytes(self) -> bytes:
+        return await trio.to_thread.run_sync(self.archive.read_bytes, self.path)
+
+    async def read_text(self, encoding: str = None) -> str:
+        return await trio.to_thread.run_sync(self.archive.read_text, self.path, encoding)
+
+    def open_binary(self) -> BinaryIO:
+        """Synchronous counterpart of open('rb'), for parsers running in worker threads."""
+        return io.BytesIO(self.archive.read_bytes(self.path))
+
+    def signature(self) -> Signature:
+        return self.archive.signature(self.path)
+
+
+def natural_key(name: str) -> tuple:
+    """Sort key ordering numbered names by their numbers: leg_2 before leg_10."""
+    return tuple(int(part) if part.isdigit() else part for part in RE_DIGITS.split(name))
+
+
+def list_source_dir(source_dir: Union[Path, ZipPath]) -> Dict[str, bool]:
+    """Names of the entries of a source directory, mapped to whether they are directories (blocking)."""
+    if isinstance(source_dir, ZipPath):
+        return source_dir.archive.children.get(source_dir.path, dict())
+    with os.scandir(os.fspath(source_dir)) as entries:
+        return {entry.name: entry.is_dir() for entry in entries}
+
+
+def read_source_text(source_file: Union[Path, ZipPath]) -> str:
+    """Text of a source file (blocking)."""
+    if isinstance(source_file, ZipPath):
+        return source_file.archive.read_text(source_file.path)
+    with open(os.fspath(source_file)) as f:
+        return f.read()
+
+
+async def open_source(source: Path) -> Union[Path, ZipPath]:
+    """Source directory of a pack, or its root in a zip archive.
+
+    An archive holding a single directory, as zipping the pack's directory does, is entered.
+    """
+    if source.suffix.lower() != '.zip' or not await source.is_file():
+        return source
+
+    root = ZipPath(os.fspath(source))
+    children = root.archive.children['']
+    if len(children) == 1 and all(children.values()):
+        return root / next(iter(children))
+    return root
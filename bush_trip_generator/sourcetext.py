@@ -0,0 +1,54 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import os
+
+from bush_trip_generator.sources import ZipPath, open_zip_archive
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from trio import Path
+    from typing import Any, Callable, Optional, Union
+
+
+class SourceText:
+    """Text of a source file, read again each time it is needed instead of being kept in memory.
+
+    Files of zipped packs are read again from their archive.
+    """
+
+    __slots__ = ('path', 'parse', 'archive_path')
+
+    def __init__(self, path: str, parse: Callable[[str], str] = None, archive_path: str = None):
+        self.path = path
+        self.parse = parse  # Module level function, so that models stay picklable
+        self.archive_path = archive_path
+
+    def read(self) -> str:
+        if self.archive_path is not None:
+            text = open_zip_archive(self.archive_path).read_text(self.path)
+        else:
+            with open(self.path) as f:
+                text = f.read()
+        return self.parse(text) if self.parse is not None else text
+
+
+def source_text(source_file: Union[Path, ZipPath], parse: Callable[[str], str] = None) -> SourceText:
+    if isinstance(source_file, ZipPath):
+        return SourceText(source_file.path, parse, archive_path=source_file.archive_path)
+    return SourceText(os.fspath(source_file), parse)
+
+
+class LazyText:
+    """Text attribute of a slotted model, stored in `slot` either as is or as its SourceText."""
+
+    def __init__(self, slot: str):
+        self.slot = slot
+
+    def __get__(self, instance: Any, owner: type = None) -> Union[LazyText, Optional[str]]:
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        return value.read() if value.__class__ is SourceText else value
+
+    def __set__(self, instance: Any, value: Union[str, SourceText]):
+        setattr(instance, self.slot, value)
@@ -1,42 +1,69 @@
 from __future__ import annotations  # Allow forward reference type annotation in py3.8
 
 import re
+import sys
 
+from bush_trip_generator.sourcetext import LazyText, SourceText, source_text
+from bush_trip_generator.template import Template
+from bush_trip_generator.tracing import span
 from trio import Path
 from typing import NewType, Union, TYPE_CHECKING
 
 if TYPE_CHECKING:
-    pass
+    from trio import CapacityLimiter
+    from typing import List, Tuple
+
+SUBLEG_TEMPLATE = Template("""<SubLeg>
+                       <Descr>{description}</Descr>
+                       {image_block}
+                       {start_wpt_block}
+                       {end_wpt_block}
+                   </SubLeg>""")
+IMAGE_TEMPLATE = Template('<ImagePath>{image}</ImagePath>')
+START_WPT_TEMPLATE = Template('<ATCWaypointStart id="{wpt_id}" />')
+END_WPT_TEMPLATE = Template('<ATCWaypointEnd id="{wpt_id}" />')
+USER_START_WPT_TEMPLATE = Template("""<ATCWaypointStart id="{wpt_id}">
+                       <idRegion>{wpt_region}</idRegion>
+                   </ATCWaypointStart>""")
+USER_END_WPT_TEMPLATE = Template("""<ATCWaypointEnd id="{wpt_id}">
+                       <idRegion>{wpt_region}</idRegion>
+                   </ATCWaypointEnd>""")
 
 
 class ICAOSubLeg:
-    def __init__(self, wpt_id: str, *, description: str = None, image: Path = None):
-        self.wpt_id = wpt_id
+    __slots__ = ('wpt_id', '_description', 'image')
+
+    description = LazyText('_description')
+
+    def __init__(self, wpt_id: str, *, description: Union[str, SourceText] = None, image: Path = None):
+        # Waypoint ids repeat across sublegs and missions: share a single copy of each
+        self.wpt_id = sys.intern(wpt_id) if isinstance(wpt_id, str) else wpt_id
         self.description = description
-        self.image = image
+        self.image = sys.intern(image) if isinstance(image, str) else image
 
-    def as_start_wpt_block(self) -> str:
-        return f'<ATCWaypointStart id="{self.wpt_id}" />'
+    def as_start_wpt_block(self) -> bytes:
+        return START_WPT_TEMPLATE.dump(wpt_id=self.wpt_id)
 
-    def as_end_wpt_block(self) -> str:
-        return f'<ATCWaypointEnd id="{self.wpt_id}" />'
+    def as_end_wpt_block(self) -> bytes:
+        return END_WPT_TEMPLATE.dump(wpt_id=self.wpt_id)
 
-    def _image_block(self) -> str:
+    def _image_block(self) -> bytes:
         if not self.image:
-            return ''
-        return f'<ImagePath>{self.image}</ImagePath>'
+            return b''
+        return IMAGE_TEMPLATE.dump(image=self.image)
 
-    def dump(self, prev: SubLeg) -> str:
-        return f"""<SubLeg>
-                       <Descr>{self.description}</Descr>
-                       {self._image_block()}
-                       {prev.as_start_wpt_block()}
-                       {self.as_end_wpt_block()}
-                   </SubLeg>"""
+    def dump(self, prev: SubLeg) -> bytes:
+        return SUBLEG_TEMPLATE.dump(description=self.description,
+                                    image_block=self._image_block(),
+                                    start_wpt_block=prev.as_start_wpt_block(),
+                                    end_wpt_block=self.as_end_wpt_block())
 
 
 class UserWptSubLeg(ICAOSubLeg):
-    def __init__(self, leg_index: int, wpt_id: str, *, description: str = None, image: Path = None):
+    __slots__ = ('leg_index',)
+
+    def __init__(self, leg_index: int, wpt_id: str, *, description: Union[str, SourceText] = None,
+                 image: Path = None):
         super().__init__(wpt_id=wpt_id,
                          description=description,
                          image=image)
@@ -46,53 +73,75 @@ class UserWptSubLeg(ICAOSubLeg):
     def _wpt_region_str(self) -> str:
         return f"!{chr(ord('A') + self.leg_index)}"
 
-    def as_start_wpt_block(self) -> str:
-        return f"""<ATCWaypointStart id="{self.wpt_id}">
-                       <idRegion>{self._wpt_region_str}</idRegion>
-                   </ATCWaypointStart>"""
+    def as_start_wpt_block(self) -> bytes:
+        return USER_START_WPT_TEMPLATE.dump(wpt_id=self.wpt_id, wpt_region=self._wpt_region_str)
 
-    def as_end_wpt_block(self) -> str:
-        return f"""<ATCWaypointEnd id="{self.wpt_id}">
-                       <idRegion>{self._wpt_region_str}</idRegion>
-                   </ATCWaypointEnd>"""
+    def as_end_wpt_block(self) -> bytes:
+        return USER_END_WPT_TEMPLATE.dump(wpt_id=self.wpt_id, wpt_region=self._wpt_region_str)
 
 
 SubLeg = NewType('SubLeg', Union[ICAOSubLeg, UserWptSubLeg])
 
 
-async def load_subleg(parent_leg_index: int, source_file: Path) -> SubLeg:
-    re_header = re.compile(r'^(?P<key>waypoint|user_waypoint|image):\s*(?P<value>.*)', re.IGNORECASE)
+RE_HEADER = re.compile(r'^(?P<key>waypoint|user_waypoint|image):\s*(?P<value>.*)', re.IGNORECASE)
+
+
+def _split_subleg(text: str, source_file: Path) -> Tuple[dict, List[str]]:
     is_in_header = True
     header = dict()
     description_lines = list()
 
-    async with await source_file.open() as f:
-        async for line in f:
-            stripped_line = line.strip()
-            if not stripped_line:
-                is_in_header = False
-            elif is_in_header:
-                if m := re_header.match(stripped_line):
-                    key = m.group('key')
-                    value = m.group('value')
-                    if key in header:
-                        raise ValueError(f'Duplicate key in {source_file}: {key}')
-                    header[key] = value
-                else:
-                    raise ValueError(f'Malformed line in {source_file}: {line}')
+    for line in text.split('\n'):
+        stripped_line = line.strip()
+        if not stripped_line:
+            is_in_header = False
+        elif is_in_header:
+            if m := RE_HEADER.match(stripped_line):
+                key = m.group('key')
+                value = m.group('value')
+                if key in header:
+                    raise ValueError(f'Duplicate key in {source_file}: {key}')
+                header[key] = value
             else:
-                description_lines.append(stripped_line)
+                raise ValueError(f'Malformed line in {source_file}: {stripped_line}')
+        else:
+            description_lines.append(stripped_line)
+    return header, description_lines
+
+
+def parse_subleg_description(text: str) -> str:
+    (_, description_lines) = _split_subleg(text, None)
+    return '\n'.join(description_lines)
+
+
+def parse_subleg(parent_leg_index: int, text: str, source_file: Path, *, lazy_description: bool = False) -> SubLeg:
+    """Parses a subleg source. With a lazy description, the description is read again from the file when rendered."""
+    (header, description_lines) = _split_subleg(text, source_file)
+    description = (source_text(source_file, parse_subleg_description) if lazy_description
+                   else '\n'.join(description_lines))
 
     if 'waypoint' in header:
         return ICAOSubLeg(wpt_id=header['waypoint'],
-                          description='\n'.join(description_lines),
+                          description=description,
                           image=header.get('image'))
 
     elif 'user_waypoint' in header:
         return UserWptSubLeg(leg_index=parent_leg_index,
                              wpt_id=header['user_waypoint'],
-                             description='\n'.join(description_lines),
+                             description=description,
                              image=header.get('image'))
 
     else:
         raise ValueError(f'Missing header in {source_file}: requires either waypoint or user_waypoint')
+
+
+async def load_subleg(parent_leg_index: int, source_file: Path, *, limiter: CapacityLimiter = None,
+                      lazy_description: bool = False) -> SubLeg:
+    if limiter is not None:
+        async with limiter:
+            return await load_subleg(parent_leg_index, source_file, lazy_description=lazy_description)
+
+    with span('read subleg', 'io'):
+        text = await source_file.read_text()
+    with span('parse subleg', 'parse'):
+        return parse_subleg(parent_leg_index, text, source_file, lazy_description=lazy_description)
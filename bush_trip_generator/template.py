@@ -0,0 +1,85 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import string
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Iterator, List, Union
+
+# Encoding declared by the header of mission files
+ENCODING = 'Windows-1252'
+
+
+def escape(value: str) -> bytes:
+    """Escapes a text value for XML content or attributes, encoded to the mission files' encoding.
+
+    Characters Windows-1252 cannot encode are written as character references.
+    """
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if value.isascii():
+        # Windows-1252 is a superset of ASCII, whose codec is much faster
+        return value.encode('ascii')
+    return value.encode(ENCODING, errors='xmlcharrefreplace')
+
+
+def _is_fragments(value: Any) -> bool:
+    return not isinstance(value, (str, bytes)) and hasattr(value, '__iter__')
+
+
+def _encode(value: Any) -> bytes:
+    if value.__class__ is bytes:
+        return value
+    if value.__class__ is str:
+        return escape(value)
+    if _is_fragments(value):
+        return b''.join(value)
+    return escape(str(value))
+
+
+class Template:
+    """A block of XML compiled from a format string: static parts are encoded once, and only the named slots
+    ({name}, no format spec nor conversion) are filled at render time.
+
+    Slot values are escaped if they are text, written as is if they are already rendered bytes, and concatenated if
+    they are an iterable of rendered fragments.
+    """
+
+    def __init__(self, text: str):
+        self.parts: List[Union[bytes, str]] = list()
+        for (literal, field, format_spec, conversion) in string.Formatter().parse(text):
+            if literal and self.parts and isinstance(self.parts[-1], bytes):
+                # Escaped braces split the literal text: merge it back into a single static part
+                self.parts[-1] += literal.encode(ENCODING)
+            elif literal:
+                self.parts.append(literal.encode(ENCODING))
+            if field is not None:
+                if not field.isidentifier() or format_spec or conversion:
+                    raise ValueError(f'Unsupported template slot: {{{field}}}')
+                self.parts.append(field)
+
+        # Compile dump() into a single concatenation of the parts, as cheap to call as an f-string
+        namespace = {'_encode': _encode, **{f'_{i}': part for (i, part) in enumerate(self.parts)}}
+        args = ', '.join(dict.fromkeys(part for part in self.parts if isinstance(part, str)))
+        body = ', '.join(f'_{i}' if isinstance(part, bytes) else
+                         f'{part} if {part}.__class__ is bytes else _encode({part})'
+                         for (i, part) in enumerate(self.parts))
+        exec(f"def dump({'*, ' if args else ''}{args}):\n    return b''.join(({body},))", namespace)
+        self.dump: Callable[..., bytes] = namespace['dump']
+
+    def render(self, **values: Any) -> Iterator[bytes]:
+        """Renders the block piecewise, streaming the fragments of iterable slot values instead of joining them."""
+        for part in self.parts:
+            if part.__class__ is bytes:
+                yield part
+            elif _is_fragments(values[part]):
+                yield from values[part]
+            else:
+                yield _encode(values[part])
@@ -0,0 +1,86 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import contextlib
+import json
+import os
+import threading
+import time
+import trio
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, ContextManager, Dict, List
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """Records spans as Chrome trace events, loadable in chrome://tracing or Perfetto."""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = list()
+        self._origin = time.perf_counter_ns()
+        self._tids: Dict[int, int] = dict()
+
+    def _tid(self) -> int:
+        # One track per trio task, or per thread when running in a worker thread
+        try:
+            key = id(trio.lowlevel.current_task())
+        except RuntimeError:
+            key = threading.get_ident()
+        return self._tids.setdefault(key, len(self._tids) + 1)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args: Any):
+        tid = self._tid()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.events.append({'name': name,
+                                'cat': category,
+                                'ph': 'X',
+                                'ts': (start - self._origin) / 1000,
+                                'dur': (end - start) / 1000,
+                                'pid': os.getpid(),
+                                'tid': tid,
+                                'args': args})
+
+    def export(self, trace_file: str):
+        with open(trace_file, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self, top: int = 10) -> str:
+        stages = dict()
+        for event in self.events:
+            if event['cat'] != 'mission':
+                (count, duration) = stages.get(event['name'], (0, 0.0))
+                stages[event['name']] = (count + 1, duration + event['dur'])
+        missions = sorted((event for event in self.events if event['cat'] == 'mission'),
+                          key=lambda event: event['dur'], reverse=True)
+
+        lines = [f'Top {top} slowest stages (cumulated):']
+        for (name, (count, duration)) in sorted(stages.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+            lines.append(f'  {name:<30} {duration / 1e6:9.3f}s  {count:6d} spans')
+        lines.append(f'Top {top} slowest missions:')
+        for event in missions[:top]:
+            lines.append(f"  {event['name']:<30} {event['dur'] / 1e6:9.3f}s")
+        return '\n'.join(lines)
+
+
+TRACER: Tracer = None
+
+
+def enable_tracing() -> Tracer:
+    global TRACER
+    TRACER = Tracer()
+    return TRACER
+
+
+def span(name: str, category: str = 'stage', **args: Any) -> ContextManager:
+    """Traces the enclosed block when tracing is enabled. Costs a single global lookup otherwise."""
+    if TRACER is None:
+        return _NO_SPAN
+    return TRACER.span(name, category, **args)
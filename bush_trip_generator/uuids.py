@@ -0,0 +1,17 @@
+import uuid
+
+# Fixed namespace, so that instance ids only depend on the identity of the mission element they are generated for
+BUSH_TRIP_NAMESPACE = uuid.UUID('4b09ec06-f3e5-430f-850b-400c368ae8f4')
+
+
+def instance_uuid_bytes(*identity: object) -> bytes:
+    """Instance id as its 16 raw bytes, to keep in models and format only when rendering."""
+    return uuid.uuid5(BUSH_TRIP_NAMESPACE, '/'.join(map(str, identity))).bytes
+
+
+def format_uuid(value: bytes) -> str:
+    return f'{{{str(uuid.UUID(bytes=value)).upper()}}}'
+
+
+def instance_uuid(*identity: object) -> str:
+    return format_uuid(instance_uuid_bytes(*identity))
@@ -0,0 +1,132 @@
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import copy
+import os
+import time
+import trio
+
+from bush_trip_generator.leg import load_leg
+from bush_trip_generator.pack import find_missions
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bush_trip_generator.mission import Mission
+    from bush_trip_generator.pack import MissionBuildResult, PackBuilder
+    from trio import Path
+    from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+DEFAULT_POLL_INTERVAL = 0.2
+DEFAULT_DEBOUNCE_DELAY = 0.1
+
+
+def scan_sources(pack_dir: str) -> Dict[str, Tuple[int, int]]:
+    """(size, mtime) of every file of the pack, by path relative to the pack directory."""
+    sources = dict()
+    for dir_path, _, file_names in os.walk(pack_dir):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            sources[os.path.relpath(file_path, pack_dir).replace(os.sep, '/')] = (stat.st_size, stat.st_mtime_ns)
+    return sources
+
+
+class PackWatcher:
+    """Keeps the missions of a pack loaded, and rebuilds only what changed whenever a source file is modified."""
+
+    def __init__(self, pack_dir: Path, builder: PackBuilder, *,
+                 on_rebuilt: Callable[[List[MissionBuildResult]], Awaitable[None]] = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, debounce_delay: float = DEFAULT_DEBOUNCE_DELAY):
+        self.pack_dir = pack_dir
+        self.builder = builder
+        self.on_rebuilt = on_rebuilt
+        self.poll_interval = poll_interval
+        self.debounce_delay = debounce_delay
+        self.missions: Dict[str, Mission] = dict()
+        self._sources: Dict[str, Tuple[int, int]] = dict()
+
+    async def _scan(self) -> Dict[str, Tuple[int, int]]:
+        return await trio.to_thread.run_sync(scan_sources, os.fspath(self.pack_dir))
+
+    async def _wait_for_changes(self) -> Set[str]:
+        """Waits for source files to change, until they stop changing for the debounce delay."""
+        changed = set()
+        while True:
+            await trio.sleep(self.debounce_delay if changed else self.poll_interval)
+            sources = await self._scan()
+            new_changes = {path
+                           for path in sources.keys() | self._sources.keys()
+                           if sources.get(path) != self._sources.get(path)}
+            self._sources = sources
+            if changed and not new_changes:
+                return changed
+            changed |= new_changes
+
+    async def _load_mission(self, mission_id: str) -> Optional[Mission]:
+        if not await (self.pack_dir / mission_id / f'{mission_id}.json').is_file():
+            self.missions.pop(mission_id, None)
+            return None
+        self.missions[mission_id] = await self.builder.load(self.pack_dir / mission_id)
+        return self.missions[mission_id]
+
+    async def _reload(self, mission_id: str, changed_paths: Set[str]) -> Optional[Mission]:
+        """Reloads only the legs whose sources changed, or the whole mission if anything else did."""
+        mission = self.missions.get(mission_id)
+        if mission is None:
+            return await self._load_mission(mission_id)
+
+        changed_legs = set()
+        for path in changed_paths:
+            parts = path.split('/')
+            leg_indices = [i for (i, leg) in enumerate(mission.legs)
+                           if leg.source_dir is not None and leg.source_dir.name == parts[1]]
+            if len(parts) < 3 or not leg_indices or not await (self.pack_dir / mission_id / parts[1]).is_dir():
+                return await self._load_mission(mission_id)
+            changed_legs.update(leg_indices)
+
+        for i in changed_legs:
+            mission.legs[i] = await load_leg(mission.legs[i].source_dir, limiter=self.builder.limiter,
+                                             lazy_descriptions=self.builder.lazy_descriptions)
+        return mission
+
+    async def _rebuild(self, changed: Set[str]) -> List[MissionBuildResult]:
+        changed_by_mission = dict()
+        for path in changed:
+            if '/' in path:
+                changed_by_mission.setdefault(path.split('/', 1)[0], set()).add(path)
+
+        results = list()
+        for (mission_id, changed_paths) in sorted(changed_by_mission.items()):
+            start = time.perf_counter()
+            try:
+                mission = await self._reload(mission_id, changed_paths)
+            except Exception as e:
+                # Keep the last good model: the author is probably still editing
+                print(f'{mission_id:<40} FAILED: {e}')
+                continue
+            if mission is not None:
+                # Build stages rewrite the model (e.g. image paths): render a copy to keep the sources model intact
+                result = await self.builder.build_mission(self.pack_dir / mission_id, mission=copy.deepcopy(mission))
+                result.duration = time.perf_counter() - start
+                results.append(result)
+        return results
+
+    async def run(self):
+        self._sources = await self._scan()
+        for mission_dir in await find_missions(self.pack_dir):
+            try:
+                await self._load_mission(mission_dir.name)
+            except Exception as e:
+                print(f'{mission_dir.name:<40} FAILED: {e}')
+        print(f'Watching {self.pack_dir} ({len(self.missions)} missions)...')
+
+        while True:
+            results = await self._rebuild(await self._wait_for_changes())
+            for result in results:
+                print(result)
+            if results and self.builder.strings is not None:
+                await self.builder.strings.save()
+            if results and all(result.ok for result in results) and self.on_rebuilt is not None:
+                await self.on_rebuilt(results)
@@ -0,0 +1,127 @@
+"""Checks that zipped mission packs read the same through ZipArchive as through zipfile, and as extracted.
+
+Usage: python -m bush_trip_generator.zipcheck [archive ...]
+
+Every entry of the given archives is read with ZipArchive and compared with zipfile.ZipFile.read(). Without archives,
+a synthetic pack is zipped every way ZipArchive reads differently: stored and deflated entries, with and without
+directory entries, and with the pack at the root of the archive or wrapped in a single top-level directory. The
+entries, directory listings and texts of each archive are then compared with those of the pack's directory.
+"""
+from __future__ import annotations  # Allow forward reference type annotation in py3.8
+
+import configargparse
+import itertools
+import os
+import posixpath
+import sys
+import tempfile
+import trio
+import zipfile
+
+from bush_trip_generator.benchmark import generate_pack
+from bush_trip_generator.sources import ZipArchive, ZipPath, list_source_dir, open_source, read_source_text
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import List
+
+WRAPPING_DIR = 'pack'
+
+
+def check_archive(archive_path: str) -> List[str]:
+    """Entries of the archive which ZipArchive reads differently from zipfile, or lists wrongly."""
+    errors = list()
+    archive = ZipArchive(archive_path)
+    try:
+        with zipfile.ZipFile(archive_path) as reference:
+            for info in reference.infolist():
+                name = info.filename.rstrip('/')
+                if info.is_dir():
+                    if name not in archive.children:
+                        errors.append(f'{name}: directory not listed')
+                    continue
+                if archive.read_bytes(name) != reference.read(info):
+                    errors.append(f'{name}: content differs from zipfile')
+                (parent, child) = posixpath.split(name)
+                if archive.children.get(parent, dict()).get(child) is not False:
+                    errors.append(f'{name}: file not listed in {parent or "the root"}')
+    finally:
+        archive.close()
+    return errors
+
+
+def write_archive(pack_dir: str, archive_path: str, *, compression: int, directory_entries: bool, wrapped: bool):
+    with zipfile.ZipFile(archive_path, 'w', compression=compression) as archive:
+        for (dir_path, dir_names, file_names) in os.walk(pack_dir):
+            dir_names.sort()
+            rel_dir = os.path.relpath(dir_path, pack_dir).replace(os.sep, '/')
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            if wrapped:
+                rel_dir = f'{WRAPPING_DIR}/{rel_dir}' if rel_dir else WRAPPING_DIR
+            if directory_entries and rel_dir:
+                archive.writestr(f'{rel_dir}/', b'')
+            for file_name in sorted(file_names):
+                archive.write(os.path.join(dir_path, file_name), f'{rel_dir}/{file_name}' if rel_dir else file_name)
+
+
+async def compare_with_directory(archive_path: str, pack_dir: str, *, wrapped: bool) -> List[str]:
+    """Differences between the sources read from the archive and from the pack's directory."""
+    errors = list()
+    root = await open_source(trio.Path(archive_path))
+    if not isinstance(root, ZipPath) or root.path != (WRAPPING_DIR if wrapped else ''):
+        return [f'open_source() returned {root!r}']
+
+    for (dir_path, _, file_names) in os.walk(pack_dir):
+        rel_dir = os.path.relpath(dir_path, pack_dir).replace(os.sep, '/')
+        source_dir = root / rel_dir if rel_dir != '.' else root
+        if list_source_dir(source_dir) != list_source_dir(trio.Path(dir_path)):
+            errors.append(f'{source_dir}: listing differs from the directory')
+        for file_name in file_names:
+            if file_name.endswith(('.txt', '.json')):
+                if read_source_text(source_dir / file_name) != read_source_text(trio.Path(dir_path) / file_name):
+                    errors.append(f'{source_dir / file_name}: text differs from the extracted file')
+    return errors
+
+
+def check_synthetic_archives(work_dir: str) -> int:
+    pack_dir = os.path.join(work_dir, 'sources')
+    generate_pack(pack_dir, missions=3, legs=3, sublegs=3, images=2)
+    failures = 0
+    variants = itertools.product((zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED), (True, False), (True, False))
+    for (i, (compression, directory_entries, wrapped)) in enumerate(variants):
+        name = (f"{'deflated' if compression == zipfile.ZIP_DEFLATED else 'stored'}"
+                f"{'' if directory_entries else ', no directory entries'}"
+                f"{', wrapped' if wrapped else ''}")
+        archive_path = os.path.join(work_dir, f'pack_{i}.zip')
+        write_archive(pack_dir, archive_path, compression=compression, directory_entries=directory_entries,
+                      wrapped=wrapped)
+        errors = check_archive(archive_path)
+        errors.extend(trio.run(lambda: compare_with_directory(archive_path, pack_dir, wrapped=wrapped)))
+        print(f"{name:<45} {'FAILED' if errors else 'ok'}")
+        for error in errors:
+            print(f'    {error}')
+        failures += bool(errors)
+    return failures
+
+
+def main() -> int:
+    parser = configargparse.Parser(description='Checks that zipped mission packs read the same as with zipfile')
+    parser.add_argument('archive', nargs='*', help='Archives to check (synthetic archives by default)')
+    args = parser.parse_args()
+
+    if not args.archive:
+        with tempfile.TemporaryDirectory() as work_dir:
+            return 1 if check_synthetic_archives(work_dir) else 0
+
+    failures = 0
+    for archive_path in args.archive:
+        errors = check_archive(archive_path)
+        print(f"{archive_path:<45} {'FAILED' if errors else 'ok'}")
+        for error in errors:
+            print(f'    {error}')
+        failures += bool(errors)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())